@@ -1,30 +1,60 @@
+import asyncio
+import logging
 import os
 import time
+from contextlib import aclosing, asynccontextmanager
+from typing import AsyncIterator, List, Optional
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from opentelemetry import trace
+from fastapi.responses import StreamingResponse
+from opentelemetry import metrics, trace
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
 # from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
 from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
 from opentelemetry.instrumentation.langchain import LangchainInstrumentor
 
 # from honeycomb_opentelemetry import HoneycombSpanExporter
 
 from .models import (
-    Document, DocumentSearchRequest, DocumentSearchResponse,
-    DocumentSummaryRequest, DocumentSummaryResponse, ErrorResponse
+    Document, DocumentBatchGetRequest, DocumentBatchGetResponse, DocumentExportRequest,
+    DocumentFacetsRequest, DocumentFacetsResponse, DocumentSearchRequest, DocumentSearchResponse,
+    DocumentSummaryRequest, DocumentSummaryResponse, DocumentSummaryResult,
+    DocumentSummaryStreamDone, ErrorResponse
 )
+from .responses import ModelResponse, server_sent_event
 from .services.summarizer import DocumentSummarizer
 from .services.document_search import DocumentSearchService
+from .services.export import MEDIA_TYPES, encode_export
 from .services.pdf_service import PDFService
+from .services.summary_cache import CachedSummary
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Warm the database pool and start background work before serving traffic,
+    and release both, and the LLM connection pools, on shutdown
+    """
+    await document_search.database.warm_pool()
+    await document_search.database.start()
+    await document_search.start()
+    # Tokenizers may be downloaded on first load; keep that off the event loop
+    await asyncio.to_thread(document_summarizer.llm_config.load_tokenizers)
+    yield
+    await document_search.stop()
+    await document_summarizer.aclose()
+    await document_search.database.dispose()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Document Summarization Service",
     description="API for summarizing documents using LangChain and OpenAI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -60,11 +90,22 @@ if exporter:
     FastAPIInstrumentor.instrument_app(app)
     LangchainInstrumentor().instrument(tracer_provider=provider)
 
+    # The metric exporter reads OTEL_EXPORTER_OTLP_ENDPOINT and appends /v1/metrics itself
+    metric_reader = PeriodicExportingMetricReader(OTLPMetricExporter())
+    metrics.set_meter_provider(MeterProvider(metric_readers=[metric_reader]))
+
 # Initialize services
 document_search = DocumentSearchService()
-document_summarizer = DocumentSummarizer()
+document_summarizer = DocumentSummarizer(database=document_search.database)
 pdf_service = PDFService()
 
+# Documents summarized at once across all requests (download, extraction and LLM call)
+summary_slots = asyncio.Semaphore(int(os.getenv("SUMMARY_CONCURRENCY", 4)))
+summary_max_ids = int(os.getenv("SUMMARY_MAX_IDS", 20))
+
+tracer = trace.get_tracer(__name__)
+logger = logging.getLogger(__name__)
+
 @app.post("/v1/search", response_model=DocumentSearchResponse)
 async def search_documents(search_request: DocumentSearchRequest):
     """
@@ -72,14 +113,97 @@ async def search_documents(search_request: DocumentSearchRequest):
     """
     try:
         start_time = time.time()
-        total_count, documents = await document_search.search_documents(search_request)
+        result = await document_search.search_documents(search_request)
         search_time_ms = int((time.time() - start_time) * 1000)
         
-        return DocumentSearchResponse(
-            results=documents,
-            result_count=total_count,
+        response = DocumentSearchResponse(
+            results=result.documents,
+            result_count=result.total_count,
+            count_mode=result.count_mode,
+            next_cursor=result.next_cursor,
+            search_time_ms=search_time_ms
+        )
+        # Projected documents only hold the selected fields, so leave the rest out
+        return ModelResponse(response, exclude_unset=bool(search_request.fields))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=ErrorResponse(
+                error="INVALID_PARAMETER",
+                message=str(e)
+            ).model_dump()
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=ErrorResponse(
+                error="INTERNAL_ERROR",
+                message="An unexpected error occurred",
+                details={"error": str(e)}
+            ).model_dump()
+        )
+
+@app.post("/v1/search/facets", response_model=DocumentFacetsResponse)
+async def search_facets(facets_request: DocumentFacetsRequest):
+    """
+    Count the documents matching the search criteria by country, language and document type
+    """
+    try:
+        start_time = time.time()
+        facets = await document_search.facet_documents(facets_request)
+        search_time_ms = int((time.time() - start_time) * 1000)
+
+        return ModelResponse(DocumentFacetsResponse(
+            facets=facets,
             search_time_ms=search_time_ms
+        ))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=ErrorResponse(
+                error="INVALID_PARAMETER",
+                message=str(e)
+            ).model_dump()
         )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=ErrorResponse(
+                error="INTERNAL_ERROR",
+                message="An unexpected error occurred",
+                details={"error": str(e)}
+            ).model_dump()
+        )
+
+async def export_stream(batches: AsyncIterator[List[Document]],
+                        first: List[Document]) -> AsyncIterator[List[Document]]:
+    """
+    Yield the batch fetched before the response started, then the rest. Once
+    headers are sent a failure can no longer become an error response, so it
+    is logged and the stream ends there.
+    """
+    async with aclosing(batches):
+        yield first
+        try:
+            async for documents in batches:
+                yield documents
+        except Exception:
+            logger.exception("export failed after the response started, closing the stream")
+
+@app.post("/v1/search/export", response_class=StreamingResponse)
+async def export_documents(export_request: DocumentExportRequest):
+    """
+    Stream every document matching the search criteria as NDJSON or CSV
+    """
+    try:
+        fields = document_search.selected_fields(export_request)
+        batches = document_search.export_documents(export_request)
+        # Validate and run the query before the status line is sent, so bad
+        # requests and database errors get a normal error response
+        try:
+            first = await batches.__anext__()
+        except StopAsyncIteration:
+            first = []
     except ValueError as e:
         raise HTTPException(
             status_code=400,
@@ -97,67 +221,169 @@ async def search_documents(search_request: DocumentSearchRequest):
                 details={"error": str(e)}
             ).model_dump()
         )
+    return StreamingResponse(
+        encode_export(export_stream(batches, first), export_request.format, list(fields) if fields else None),
+        media_type=MEDIA_TYPES[export_request.format],
+        headers={"Content-Disposition": f'attachment; filename="documents.{export_request.format.value}"'}
+    )
+
+@app.post("/v1/documents:batchGet", response_model=DocumentBatchGetResponse)
+async def batch_get_documents(request: DocumentBatchGetRequest):
+    """
+    Fetch documents by id in one round-trip, in the order requested
+    """
+    try:
+        start_time = time.time()
+        documents, missing_ids = await document_search.get_documents(request.ids)
+        lookup_time_ms = int((time.time() - start_time) * 1000)
+
+        return ModelResponse(DocumentBatchGetResponse(
+            documents=documents,
+            missing_ids=missing_ids,
+            lookup_time_ms=lookup_time_ms
+        ))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=ErrorResponse(
+                error="INTERNAL_ERROR",
+                message="An unexpected error occurred",
+                details={"error": str(e)}
+            ).model_dump()
+        )
+
+def elapsed_ms(since: float) -> int:
+    return int((time.perf_counter() - since) * 1000)
+
+def copy_for_summary(document: Document, model: Optional[str]) -> Document:
+    """
+    Copy of the document with the requested model applied. Concurrent lookups of
+    the same id share one Document, so summaries work on a copy.
+    """
+    return document.model_copy(update={"model": model} if model else None)
+
+def prepare_for_summary(document: Document) -> None:
+    """
+    Fall back to the abstract when the document has no content
+
+    Raises:
+        ValueError: If there is nothing to summarize
+    """
+    # If no content available, use abstract
+    if not document.content and document.abstract:
+        document.content = document.abstract
+
+    if not document.content:
+        raise ValueError("No content available for summarization")
+
+async def summarize_document(doc_id: str, document: Optional[Document], model: Optional[str]) -> DocumentSummaryResult:
+    """
+    Download, extract and summarize one document, reporting failures in the result
+    """
+    start_time = time.perf_counter()
+
+    def failed(error: str, message: str, details: Optional[dict] = None, **timings) -> DocumentSummaryResult:
+        return DocumentSummaryResult(
+            id=doc_id,
+            error=ErrorResponse(error=error, message=message, details=details),
+            summary_time_ms=elapsed_ms(start_time),
+            **timings
+        )
+
+    if not document:
+        return failed("INVALID_PARAMETER", f"Document not found: {doc_id}")
+
+    document = copy_for_summary(document, model)
+    download_time_ms = None
+    try:
+        # A summary cached for this PDF's url and updated_at needs neither a slot nor a download
+        summarize_start = time.perf_counter()
+        summary = await document_summarizer.lookup(document)
+        if summary is None:
+            async with summary_slots:
+                # If URL is provided, download and extract text
+                if document.url:
+                    download_start = time.perf_counter()
+                    try:
+                        document.content = await pdf_service.download_and_extract_text(
+                            doc_id=doc_id,
+                            url=document.url
+                        )
+                    except (ValueError, IOError) as e:
+                        return failed("PDF_PROCESSING_ERROR", str(e), download_time_ms=elapsed_ms(download_start))
+                    download_time_ms = elapsed_ms(download_start)
+
+                prepare_for_summary(document)
+
+                # Generate summary
+                summarize_start = time.perf_counter()
+                summary = await document_summarizer.summarize(document)
+
+        return DocumentSummaryResult(
+            id=doc_id,
+            summary_text=summary.summary_text,
+            cache_hit=summary.cache_hit,
+            download_time_ms=download_time_ms,
+            summarize_time_ms=elapsed_ms(summarize_start),
+            summary_time_ms=elapsed_ms(start_time)
+        )
+
+    except ValueError as e:
+        return failed("INVALID_PARAMETER", str(e), download_time_ms=download_time_ms)
+    except Exception as e:
+        return failed(
+            "INTERNAL_ERROR", "An unexpected error occurred", {"error": str(e)}, download_time_ms=download_time_ms
+        )
 
 @app.post("/v1/summary", response_model=DocumentSummaryResponse)
 async def generate_summaries(request: DocumentSummaryRequest):
     """
-    Generate AI-powered summaries for specified documents
+    Generate AI-powered summaries for specified documents.
+
+    Every distinct id is summarized concurrently (at most SUMMARY_CONCURRENCY
+    documents at a time). With several ids, failures are reported per id; when
+    every id fails, or the only one does, the request fails with an HTTP error.
     """
     start_time = time.time()
     try:
-        # Get the first document (we'll enhance this for multiple documents later)
-        doc_id = request.ids[0] if request.ids else None
-        if not doc_id:
+        ids = list(dict.fromkeys(request.ids))
+        if not ids:
             raise ValueError("No document IDs provided")
+        if len(ids) > summary_max_ids:
+            raise ValueError(f"At most {summary_max_ids} document IDs can be summarized at once")
+
+        # The lookups arrive together, so the document batcher fetches them in one query
+        documents = await asyncio.gather(*(document_search.get_document(doc_id) for doc_id in ids))
+        results = await asyncio.gather(*(
+            summarize_document(doc_id, document, request.model) for doc_id, document in zip(ids, documents)
+        ))
+
+        if all(result.error for result in results):
+            # Nothing was summarized: fail with the first id's error, and with
+            # several ids, every id's result in details
+            error = results[0].error
+            if len(results) > 1:
+                error = error.model_copy(update={
+                    "details": {"summaries": [result.model_dump(mode="json") for result in results]}
+                })
+            raise HTTPException(
+                status_code=500 if error.error == "INTERNAL_ERROR" else 400,
+                detail=error.model_dump()
+            )
 
-        # Get document details from search
-        _, documents = await document_search.search_documents(
-            DocumentSearchRequest(id=doc_id)
-        )
-        
-        if not documents:
-            raise ValueError(f"Document not found: {doc_id}")
-        
-        document = documents[0]
-        
-        # If URL is provided, download and extract text
-        if document.url:
-            try:
-                document.content = await pdf_service.download_and_extract_text(
-                    doc_id=doc_id,
-                    url=document.url
-                )
-            except (ValueError, IOError) as e:
-                raise HTTPException(
-                    status_code=400,
-                    detail=ErrorResponse(
-                        error="PDF_PROCESSING_ERROR",
-                        message=str(e)
-                    ).model_dump()
-                )
-        
-        # If no content available, use abstract
-        if not document.content and document.abstract:
-            document.content = document.abstract
-        
-        if not document.content:
-            raise ValueError("No content available for summarization")
-        
-        # Update model if specified in request
-        if request.model:
-            document.model = request.model
-            
-        # Generate summary
-        summary = await document_summarizer.summarize(document)
-        
         # Calculate time taken
         summary_time_ms = int((time.time() - start_time) * 1000)
         
-        return DocumentSummaryResponse(
-            summary_text=summary,
-            summary_time_ms=summary_time_ms
-        )
+        succeeded = [result for result in results if not result.error]
+        return ModelResponse(DocumentSummaryResponse(
+            summary_text="\n\n".join(result.summary_text for result in succeeded),
+            summary_time_ms=summary_time_ms,
+            cache_hit=bool(succeeded) and all(result.cache_hit for result in succeeded),
+            summaries=results
+        ))
         
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(
             status_code=400,
@@ -176,6 +402,129 @@ async def generate_summaries(request: DocumentSummaryRequest):
             ).model_dump()
         )
 
+async def generate_summary_events(doc_id: str, document: Document, done: DocumentSummaryStreamDone,
+                                  events: asyncio.Queue) -> bool:
+    """
+    Download, extract and summarize one document under a summary slot, putting
+    stage events and summary pieces on ``events`` and then None. It runs as its
+    own task, so the slot is released when the LLM finishes rather than when a
+    slow client has read every event.
+
+    Returns:
+        False if the PDF could not be processed and an error event was queued instead
+    """
+    try:
+        async with summary_slots:
+            # If URL is provided, download and extract text
+            if document.url:
+                events.put_nowait(server_sent_event("stage", {"stage": "download"}))
+                stage_start = time.perf_counter()
+                try:
+                    async with pdf_service.download(doc_id, document.url) as pdf_path:
+                        done.download_time_ms = elapsed_ms(stage_start)
+                        events.put_nowait(server_sent_event("stage", {"stage": "extract"}))
+                        stage_start = time.perf_counter()
+                        document.content = await pdf_service.extract_text(pdf_path)
+                        done.extract_time_ms = elapsed_ms(stage_start)
+                except (ValueError, IOError) as e:
+                    events.put_nowait(server_sent_event(
+                        "error", ErrorResponse(error="PDF_PROCESSING_ERROR", message=str(e)).model_dump()
+                    ))
+                    return False
+
+            prepare_for_summary(document)
+
+            events.put_nowait(server_sent_event("stage", {"stage": "summarize"}))
+            stage_start = time.perf_counter()
+            async for piece in document_summarizer.stream(document):
+                events.put_nowait(piece)
+            done.summarize_time_ms = elapsed_ms(stage_start)
+            return True
+    finally:
+        events.put_nowait(None)
+
+async def stream_summary_events(doc_id: str, model: Optional[str]) -> AsyncIterator[bytes]:
+    """
+    Server-Sent Events for summarizing one document: a stage event as each stage
+    starts, token events as the LLM produces the summary, then a done event with
+    timings. A failure ends the stream with an error event instead.
+    """
+    start_time = time.perf_counter()
+    with tracer.start_as_current_span("summary_stream") as span:
+        span.set_attribute("doc_id", doc_id)
+        done = DocumentSummaryStreamDone(id=doc_id, summary_time_ms=0)
+
+        def token_event(piece: CachedSummary) -> bytes:
+            if done.time_to_first_token_ms is None:
+                done.time_to_first_token_ms = elapsed_ms(start_time)
+                span.set_attribute("summary.time_to_first_token_ms", done.time_to_first_token_ms)
+            done.cache_hit = piece.cache_hit
+            return server_sent_event("token", {"text": piece.summary_text})
+
+        try:
+            yield server_sent_event("stage", {"stage": "lookup"})
+            stage_start = time.perf_counter()
+            document = await document_search.get_document(doc_id)
+            done.lookup_time_ms = elapsed_ms(stage_start)
+            if not document:
+                raise ValueError(f"Document not found: {doc_id}")
+
+            document = copy_for_summary(document, model)
+            # A summary cached for this PDF's url and updated_at needs neither a slot nor a download
+            cached = await document_summarizer.lookup(document)
+            if cached is not None:
+                yield server_sent_event("stage", {"stage": "summarize"})
+                stage_start = time.perf_counter()
+                yield token_event(cached)
+                done.summarize_time_ms = elapsed_ms(stage_start)
+            else:
+                events: asyncio.Queue = asyncio.Queue()
+                producer = asyncio.create_task(generate_summary_events(doc_id, document, done, events))
+                try:
+                    while (event := await events.get()) is not None:
+                        yield event if isinstance(event, bytes) else token_event(event)
+                    if not await producer:
+                        return
+                finally:
+                    # No-op once generation has finished; stops it if the client went away
+                    producer.cancel()
+
+            done.summary_time_ms = elapsed_ms(start_time)
+            span.set_attribute("summary.total_ms", done.summary_time_ms)
+            span.set_attribute("summary.cache_hit", done.cache_hit)
+            yield server_sent_event("done", done.model_dump())
+
+        except ValueError as e:
+            yield server_sent_event("error", ErrorResponse(error="INVALID_PARAMETER", message=str(e)).model_dump())
+        except Exception as e:
+            span.record_exception(e)
+            yield server_sent_event("error", ErrorResponse(
+                error="INTERNAL_ERROR",
+                message="An unexpected error occurred",
+                details={"error": str(e)}
+            ).model_dump())
+
+@app.post("/v1/summary/stream", response_class=StreamingResponse)
+async def stream_summary(request: DocumentSummaryRequest):
+    """
+    Summarize one document, streaming progress and the summary as Server-Sent Events
+    """
+    ids = list(dict.fromkeys(request.ids))
+    if len(ids) != 1:
+        raise HTTPException(
+            status_code=400,
+            detail=ErrorResponse(
+                error="INVALID_PARAMETER",
+                message="Exactly one document ID must be provided to stream a summary"
+            ).model_dump()
+        )
+    return StreamingResponse(
+        stream_summary_events(ids[0], request.model),
+        media_type="text/event-stream",
+        # Keep proxies from caching or buffering the events
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/v1/health")
 async def health_check():
     """
@@ -1,7 +1,7 @@
 from datetime import datetime
 from enum import Enum
-from typing import Optional, List
-from pydantic import BaseModel, Field, conint
+from typing import Dict, Optional, List
+from pydantic import BaseModel, Field, confloat, conint, conlist
 
 class LLMModel(str, Enum):
     """
@@ -12,6 +12,59 @@ class LLMModel(str, Enum):
     CLAUDE_3_SONNET = "claude-3-sonnet"
     CLAUDE_3_OPUS = "claude-3-opus"
 
+class CountMode(str, Enum):
+    """
+    How result_count is computed for a search
+    """
+    EXACT = "exact"
+    CAPPED = "capped"
+    ESTIMATED = "estimated"
+
+class SearchMode(str, Enum):
+    """
+    How search_text is matched against documents
+    """
+    ILIKE = "ilike"
+    FULLTEXT = "fulltext"
+    FUZZY = "fuzzy"
+    INDEX = "index"
+
+class FacetField(str, Enum):
+    """
+    Document fields that facet counts can be requested for
+    """
+    COUNTRY = "country"
+    LANGUAGE = "language"
+    DOCUMENT_TYPE = "document_type"
+    MAJOR_DOCUMENT_TYPE = "major_document_type"
+
+class DocumentField(str, Enum):
+    """
+    Document fields that can be selected in search results
+    """
+    ID = "id"
+    TITLE = "title"
+    ABSTRACT = "abstract"
+    DOCUMENT_DATE = "document_date"
+    DOCUMENT_TYPE = "document_type"
+    MAJOR_DOCUMENT_TYPE = "major_document_type"
+    VOLUME_NUMBER = "volume_number"
+    TOTAL_VOLUME_NUMBER = "total_volume_number"
+    URL = "url"
+    LANGUAGE = "language"
+    COUNTRY = "country"
+    AUTHOR = "author"
+    PUBLISHER = "publisher"
+    CREATED_AT = "created_at"
+    UPDATED_AT = "updated_at"
+
+class ExportFormat(str, Enum):
+    """
+    Output formats for search exports
+    """
+    NDJSON = "ndjson"
+    CSV = "csv"
+
 class DocumentSearchRequest(BaseModel):
     """
     Request model for document search
@@ -21,6 +74,8 @@ class DocumentSearchRequest(BaseModel):
     }
     id: Optional[str] = Field(None, description="Search by document ID")
     search_text: Optional[str] = Field(None, description="Search by document title or abstract")
+    search_mode: Optional[SearchMode] = Field(None, description="How search_text is matched: ilike (substring), fulltext (ranked full-text search), fuzzy (trigram similarity) or index (BM25 over the in-memory index). Defaults to SEARCH_DEFAULT_MODE")
+    similarity_threshold: Optional[confloat(ge=0, le=1)] = Field(None, description="Minimum word similarity for fuzzy search (default: SEARCH_SIMILARITY_THRESHOLD, 0.3)")
     title: Optional[str] = Field(None, description="Search by document title")
     abstract: Optional[str] = Field(None, description="Search by document abstract")
     doc_type: Optional[str] = Field(None, description="Filter by document type")
@@ -30,6 +85,27 @@ class DocumentSearchRequest(BaseModel):
     start_date: Optional[datetime] = Field(None, description="Filter by start date")
     end_date: Optional[datetime] = Field(None, description="Filter by end date")
     max_results: Optional[conint(ge=1)] = Field(3, description="Maximum number of results to return (default: 3)")
+    cursor: Optional[str] = Field(None, description="Opaque cursor from a previous response's next_cursor to fetch the following page")
+    fields: Optional[List[DocumentField]] = Field(None, description="Document fields to return; id is always included (default: all fields)")
+    count_mode: Optional[CountMode] = Field(CountMode.EXACT, description="How to compute result_count: exact, capped (stop counting at count_cap) or estimated (planner row estimate)")
+    count_cap: Optional[conint(ge=1)] = Field(None, description="Threshold for capped counts (default: SEARCH_COUNT_CAP, 10000)")
+    use_cache: Optional[bool] = Field(True, description="Serve and store this search in the result cache; set to false to always query the database")
+
+class DocumentFacetsRequest(DocumentSearchRequest):
+    """
+    Request model for facet counts over the documents matching a search.
+    Paging and count options of the search request are ignored.
+    """
+    facets: List[FacetField] = Field(default_factory=lambda: list(FacetField), description="Fields to count matching documents by (default: all)")
+    facet_limit: conint(ge=1) = Field(10, description="Maximum number of values returned per facet, most frequent first (default: 10)")
+
+class DocumentExportRequest(DocumentSearchRequest):
+    """
+    Request model for exporting every document matching a search.
+    Paging and count options of the search request are ignored.
+    """
+    format: ExportFormat = Field(ExportFormat.NDJSON, description="Output format: ndjson (one JSON document per line) or csv")
+    max_results: Optional[conint(ge=1)] = Field(None, description="Maximum number of documents to export (default: all matches)")
 
 class Document(BaseModel):
     """
@@ -56,6 +132,12 @@ class Document(BaseModel):
     content: Optional[str] = Field(None, description="Document content to summarize")
     model: Optional[LLMModel] = Field(default=LLMModel.GPT35_TURBO, description="LLM model to use for processing")
 
+class DocumentBatchGetRequest(BaseModel):
+    """
+    Request model for fetching documents by id
+    """
+    ids: conlist(str, min_length=1) = Field(..., description="Document IDs to fetch")
+
 class DocumentSummaryRequest(BaseModel):
     """
     Request model for document summarization
@@ -67,15 +149,16 @@ class DocumentSummaryRequest(BaseModel):
     model: Optional[str] = Field(None, description="AI model to use for summarization")
     modelOptions: Optional[dict[str, str]] = Field(None, description="Additional options for the AI model")
 
-class DocumentSummaryResponse(BaseModel):
+class DocumentBatchGetResponse(BaseModel):
     """
-    Response model for document summarization
+    Response model for fetching documents by id
     """
     model_config = {
         'protected_namespaces': ()
     }
-    summary_text: str = Field(..., description="Generated summary text")
-    summary_time_ms: int = Field(..., description="Time taken to generate the summary in milliseconds")
+    documents: List[Document] = Field(..., description="Documents found, in the order their ids were requested")
+    missing_ids: List[str] = Field(default_factory=list, description="Requested ids with no matching document")
+    lookup_time_ms: int = Field(..., description="Time taken to fetch the documents in milliseconds")
 
 class ErrorResponse(BaseModel):
     """
@@ -88,6 +171,49 @@ class ErrorResponse(BaseModel):
     message: str = Field(..., description="Human-readable error message")
     details: Optional[dict] = Field(None, description="Additional error details")
 
+class DocumentSummaryResult(BaseModel):
+    """
+    Summary of one requested document, or why it could not be summarized
+    """
+    model_config = {
+        'protected_namespaces': ()
+    }
+    id: str = Field(..., description="Document ID")
+    summary_text: Optional[str] = Field(None, description="Generated summary text, absent if the document failed")
+    cache_hit: bool = Field(False, description="Whether the summary was served from the summary cache instead of the LLM")
+    error: Optional[ErrorResponse] = Field(None, description="Why the document could not be summarized")
+    download_time_ms: Optional[int] = Field(None, description="Time taken to download and extract the PDF in milliseconds")
+    summarize_time_ms: Optional[int] = Field(None, description="Time taken by the summarizer (LLM or cache) in milliseconds")
+    summary_time_ms: int = Field(..., description="Time taken for this document in milliseconds, including waiting for a free slot")
+
+class DocumentSummaryResponse(BaseModel):
+    """
+    Response model for document summarization
+    """
+    model_config = {
+        'protected_namespaces': ()
+    }
+    summary_text: str = Field(..., description="Generated summary text; with several ids, the successful summaries in request order separated by blank lines")
+    summary_time_ms: int = Field(..., description="Time taken to generate the summary in milliseconds")
+    cache_hit: bool = Field(False, description="Whether every summary was served from the summary cache instead of the LLM")
+    summaries: List[DocumentSummaryResult] = Field(default_factory=list, description="One result per distinct requested id, in request order")
+
+class DocumentSummaryStreamDone(BaseModel):
+    """
+    Data of the done event that ends a streamed summary
+    """
+    model_config = {
+        'protected_namespaces': ()
+    }
+    id: str = Field(..., description="Document ID")
+    cache_hit: bool = Field(False, description="Whether the summary was served from the summary cache instead of the LLM")
+    lookup_time_ms: Optional[int] = Field(None, description="Time taken to look up the document in milliseconds")
+    download_time_ms: Optional[int] = Field(None, description="Time taken to download the PDF in milliseconds")
+    extract_time_ms: Optional[int] = Field(None, description="Time taken to extract the PDF text in milliseconds")
+    time_to_first_token_ms: Optional[int] = Field(None, description="Time from the request until the first summary text was sent, in milliseconds")
+    summarize_time_ms: Optional[int] = Field(None, description="Time taken by the summarizer (LLM or cache) in milliseconds")
+    summary_time_ms: int = Field(..., description="Total time taken in milliseconds")
+
 class DocumentSearchResponse(BaseModel):
     """
     Response model for document search results
@@ -97,4 +223,23 @@ class DocumentSearchResponse(BaseModel):
     }
     results: List[Document] = Field(..., description="List of matching documents")
     result_count: int = Field(..., description="Total number of matching documents")
+    count_mode: CountMode = Field(CountMode.EXACT, description="How result_count was produced: exact, capped (result_count is a lower bound) or estimated")
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page of results, absent on the last page")
     search_time_ms: int = Field(..., description="Time taken to perform the search in milliseconds")
+
+class FacetCount(BaseModel):
+    """
+    Number of matching documents with one value of a facet field
+    """
+    value: str = Field(..., description="Field value")
+    count: int = Field(..., description="Number of matching documents with this value")
+
+class DocumentFacetsResponse(BaseModel):
+    """
+    Response model for facet counts
+    """
+    model_config = {
+        'protected_namespaces': ()
+    }
+    facets: Dict[str, List[FacetCount]] = Field(..., description="Counts per requested facet, most frequent value first")
+    search_time_ms: int = Field(..., description="Time taken to compute the facets in milliseconds")
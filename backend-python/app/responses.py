@@ -0,0 +1,40 @@
+from typing import Any
+import orjson
+from fastapi.responses import Response
+from pydantic import BaseModel
+from pydantic_core import to_jsonable_python
+
+def dumps(content: Any) -> bytes:
+    """
+    Encode JSON with orjson, producing the same bytes as pydantic's model_dump_json
+    for the dump of a model
+    """
+    return orjson.dumps(content, default=to_jsonable_python, option=orjson.OPT_UTC_Z)
+
+class ModelResponse(Response):
+    """
+    JSON response for a pydantic response model, encoded with orjson.
+
+    Returning a model from an endpoint makes FastAPI validate it again against
+    response_model and encode it with jsonable_encoder and json.dumps. Returning
+    a ModelResponse skips both; the route's response_model still documents the
+    schema. The bytes match what FastAPI would send: naive datetimes are written
+    as-is, aware UTC datetimes end in Z like pydantic's, and anything orjson does
+    not know is handed to pydantic's own JSON conversion.
+    """
+    media_type = "application/json"
+
+    def __init__(self, content: Any, status_code: int = 200, exclude_unset: bool = False, **kwargs):
+        self.exclude_unset = exclude_unset
+        super().__init__(content, status_code=status_code, **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            content = content.model_dump(exclude_unset=self.exclude_unset)
+        return dumps(content)
+
+def server_sent_event(event: str, data: Any) -> bytes:
+    """
+    Encode one Server-Sent Event with a JSON data line
+    """
+    return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Generic, Hashable, List, Optional, Set, TypeVar
+from opentelemetry import metrics
+
+meter = metrics.get_meter(__name__)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+class BatcherMetrics:
+    """
+    OpenTelemetry instruments shared by every BatchLoader
+    """
+    def __init__(self):
+        self.batch_size = meter.create_histogram(
+            "batcher.batch_size",
+            description="Distinct keys loaded per batch"
+        )
+        self.wait_time = meter.create_histogram(
+            "batcher.wait_time",
+            unit="ms",
+            description="Time from the first key of a batch arriving to the batch being dispatched"
+        )
+        self.coalesced = meter.create_counter(
+            "batcher.coalesced",
+            description="Lookups that joined a pending lookup for the same key"
+        )
+
+batcher_metrics = BatcherMetrics()
+
+class BatchLoader(Generic[K, V]):
+    """
+    DataLoader-style micro-batcher.
+
+    Keys requested through ``load`` are collected for up to ``max_wait_ms`` (or
+    until ``max_batch_size`` distinct keys are pending) and fetched with a single
+    ``load_many`` call. Concurrent lookups of the same key share one result,
+    whether it is still pending or already part of a batch in flight.
+    """
+    def __init__(self, name: str, load_many: Callable[[List[K]], Awaitable[Dict[K, V]]],
+                 max_batch_size: int, max_wait_ms: float):
+        self.name = name
+        self.load_many = load_many
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self._pending: Dict[K, asyncio.Future] = {}
+        self._inflight: Dict[K, asyncio.Future] = {}
+        self._first_at = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # The event loop only keeps weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def load(self, key: K) -> Optional[V]:
+        """
+        Return the value for ``key``, or None if ``load_many`` did not return one
+        """
+        future = self._pending.get(key) or self._inflight.get(key)
+        if future is not None:
+            batcher_metrics.coalesced.add(1, {"batcher.name": self.name})
+        else:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            if not self._pending:
+                self._first_at = time.perf_counter()
+                self._timer = loop.call_later(self.max_wait_ms / 1000, self._dispatch)
+            self._pending[key] = future
+            if len(self._pending) >= self.max_batch_size:
+                self._dispatch()
+        # A caller that goes away must not cancel a lookup other callers are waiting on
+        return await asyncio.shield(future)
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        self._inflight.update(batch)
+        attributes = {"batcher.name": self.name}
+        batcher_metrics.batch_size.record(len(batch), attributes)
+        batcher_metrics.wait_time.record((time.perf_counter() - self._first_at) * 1000, attributes)
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def aclose(self) -> None:
+        """
+        Cancel pending lookups and batches in flight, and wait for the batches to finish
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.cancel()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, batch: Dict[K, asyncio.Future]) -> None:
+        try:
+            values = await self.load_many(list(batch))
+        except asyncio.CancelledError:
+            for future in batch.values():
+                future.cancel()
+            raise
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._finish(batch)
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(values.get(key))
+
+    def _finish(self, batch: Dict[K, asyncio.Future]) -> None:
+        for key, future in batch.items():
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
@@ -0,0 +1,133 @@
+from datetime import datetime
+from typing import Dict, Iterable, Mapping, Optional, Sequence
+import numpy as np
+
+WORD_BITS = 64
+
+# Set bits in each byte value; numpy < 2.0 has no bitwise_count
+_BYTE_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+class BitmapIndex:
+    """
+    Bit-packed bitmaps over index slots: one per distinct value of each categorical
+    column, plus one of the live slots.
+
+    A filter is the AND of the bitmaps of its values with the live bitmap, and a facet
+    count is the popcount of a value's bitmap ANDed with a filter. A column's bitmaps
+    are the rows of one matrix, so all of its counts take one AND and one popcount
+    pass. created_at is kept
+    as a datetime64 column, so date ranges are one vectorized comparison.
+    Removed slots are only cleared from the live bitmap.
+    """
+    def __init__(self, columns: Sequence[str], capacity: int = 1024):
+        self.columns = tuple(columns)
+        self.size = 0
+        self._words = max(1, -(-capacity // WORD_BITS))
+        self.live = np.zeros(self._words, dtype=np.uint64)
+        # column -> value -> row of the column's bitmap matrix
+        self.values: Dict[str, Dict[str, int]] = {column: {} for column in self.columns}
+        self.matrices: Dict[str, np.ndarray] = {
+            column: np.zeros((8, self._words), dtype=np.uint64) for column in self.columns
+        }
+        self.created_at = np.full(self._words * WORD_BITS, np.datetime64("NaT"), dtype="datetime64[us]")
+
+    def append(self, values: Mapping[str, Optional[str]], created_at: Optional[datetime]) -> int:
+        """
+        Add the next slot with the given column values; None values are left out of every bitmap
+        Returns the slot
+        """
+        slot = self.size
+        if slot >= self._words * WORD_BITS:
+            self._grow()
+        word, bit = slot // WORD_BITS, np.uint64(1 << (slot % WORD_BITS))
+        self.live[word] |= bit
+        for column in self.columns:
+            value = values.get(column)
+            if value is None:
+                continue
+            rows = self.values[column]
+            row = rows.get(value)
+            if row is None:
+                row = rows[value] = len(rows)
+                matrix = self.matrices[column]
+                if row >= len(matrix):
+                    self.matrices[column] = np.vstack([matrix, np.zeros_like(matrix)])
+            self.matrices[column][row, word] |= bit
+        if created_at is not None:
+            self.created_at[slot] = np.datetime64(created_at, "us")
+        self.size += 1
+        return slot
+
+    def remove(self, slot: int) -> None:
+        self.live[slot // WORD_BITS] &= ~np.uint64(1 << (slot % WORD_BITS))
+
+    def _grow(self) -> None:
+        extra = self._words
+        self._words += extra
+        self.live = np.concatenate([self.live, np.zeros(extra, dtype=np.uint64)])
+        for column, matrix in self.matrices.items():
+            self.matrices[column] = np.hstack([matrix, np.zeros((len(matrix), extra), dtype=np.uint64)])
+        self.created_at = np.concatenate([
+            self.created_at, np.full(extra * WORD_BITS, np.datetime64("NaT"), dtype="datetime64[us]")
+        ])
+
+    def _pack(self, flags: np.ndarray) -> np.ndarray:
+        # Slot n is bit n % 64 of word n // 64, as in append
+        return np.packbits(flags, bitorder="little").view(np.uint64)
+
+    def select(self, equals: Mapping[str, Optional[str]], start: Optional[datetime] = None,
+               end: Optional[datetime] = None) -> np.ndarray:
+        """
+        Bitmap of the live slots whose columns equal every non-empty value in ``equals``
+        and whose created_at lies within [start, end]
+        """
+        mask = self.live.copy()
+        for column, value in equals.items():
+            if not value:
+                continue
+            row = self.values[column].get(value)
+            if row is None:
+                return np.zeros_like(mask)
+            np.bitwise_and(mask, self.matrices[column][row], out=mask)
+        if start is not None or end is not None:
+            # NaT compares false, so rows without created_at never match a date range
+            in_range = np.ones(len(self.created_at), dtype=bool)
+            if start is not None:
+                in_range &= self.created_at >= np.datetime64(start, "us")
+            if end is not None:
+                in_range &= self.created_at <= np.datetime64(end, "us")
+            np.bitwise_and(mask, self._pack(in_range), out=mask)
+        return mask
+
+    def from_slots(self, slots: Iterable[int]) -> np.ndarray:
+        """
+        Bitmap with exactly the given slots set
+        """
+        flags = np.zeros(self._words * WORD_BITS, dtype=bool)
+        flags[np.fromiter(slots, dtype=np.int64)] = True
+        return self._pack(flags)
+
+    @staticmethod
+    def contains(mask: np.ndarray, slots: np.ndarray) -> np.ndarray:
+        """
+        Whether each of ``slots`` is set in ``mask``, as a boolean array
+        """
+        shifts = (slots % WORD_BITS).astype(np.uint64)
+        return ((mask[slots // WORD_BITS] >> shifts) & np.uint64(1)).astype(bool)
+
+    def counts(self, column: str, mask: np.ndarray) -> Dict[str, int]:
+        """
+        Number of slots in ``mask`` for each value of ``column``, leaving out zero counts
+        """
+        values = self.values[column]
+        if not values:
+            return {}
+        masked = self.matrices[column][:len(values)] & mask
+        counts = _BYTE_POPCOUNT[masked.view(np.uint8)].sum(axis=1, dtype=np.int64).tolist()
+        return {value: counts[row] for value, row in values.items() if counts[row]}
+
+    def memory_bytes(self) -> int:
+        return (
+            self.live.nbytes + self.created_at.nbytes
+            + sum(matrix.nbytes for matrix in self.matrices.values())
+        )
@@ -0,0 +1,196 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Generic, Hashable, Optional, TypeVar
+from opentelemetry import metrics
+
+meter = metrics.get_meter(__name__)
+
+V = TypeVar("V")
+
+class TTLCache(Generic[V]):
+    """
+    Bounded LRU cache whose entries expire ``ttl_seconds`` after they were stored
+    """
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple[float, V]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """
+        Return the cached value, or None if it is missing or expired
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: V) -> None:
+        if self.max_entries <= 0 or self.ttl_seconds <= 0:
+            return
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class CacheMetrics:
+    """
+    OpenTelemetry instruments shared by every LoadingCache
+    """
+    def __init__(self):
+        self.requests = meter.create_counter(
+            "cache.requests",
+            description="Cache lookups by cache.result (hit, refresh, coalesced, miss)"
+        )
+        self.evictions = meter.create_counter(
+            "cache.evictions",
+            description="Entries evicted to stay under the size limit"
+        )
+        self.size = meter.create_up_down_counter(
+            "cache.size",
+            unit="By",
+            description="Approximate size of cached entries"
+        )
+
+cache_metrics = CacheMetrics()
+
+class _Entry(Generic[V]):
+    __slots__ = ("value", "size", "stored_at")
+
+    def __init__(self, value: V, size: int, stored_at: float):
+        self.value = value
+        self.size = size
+        self.stored_at = stored_at
+
+class LoadingCache(Generic[V]):
+    """
+    Async cache bounded by an approximate size in bytes.
+
+    - Entries expire ``ttl_seconds`` after they were loaded.
+    - Concurrent misses for the same key share a single load (stampede protection).
+    - Once an entry is older than ``refresh_ratio * ttl_seconds`` it is still served,
+      but a background load refreshes it so hot keys never expire in front of a request.
+    - ``clear()`` drops every entry, and loads that started before it are not stored.
+    """
+    def __init__(self, name: str, max_bytes: int, ttl_seconds: float, refresh_ratio: float,
+                 sizeof: Callable[[V], int]):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.refresh_ratio = refresh_ratio
+        self.sizeof = sizeof
+        self._entries: "OrderedDict[Hashable, _Entry[V]]" = OrderedDict()
+        self._loading: dict[Hashable, asyncio.Future] = {}
+        self._bytes = 0
+        self._generation = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.ttl_seconds > 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[V]]) -> tuple[V, str]:
+        """
+        Return the cached value for ``key``, loading it with ``loader`` if needed
+
+        Returns:
+            A tuple of (value, outcome) where outcome is one of
+            hit, refresh (hit that triggered a background refresh), coalesced
+            (joined a load already in flight) or miss
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.stored_at
+            if age <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                outcome = "hit"
+                if age > self.ttl_seconds * self.refresh_ratio and key not in self._loading:
+                    self._start_load(key, loader)
+                    outcome = "refresh"
+                cache_metrics.requests.add(1, {"cache.name": self.name, "cache.result": outcome})
+                return entry.value, outcome
+            self._remove(key)
+
+        future = self._loading.get(key)
+        outcome = "coalesced" if future is not None else "miss"
+        if future is None:
+            future = self._start_load(key, loader)
+        cache_metrics.requests.add(1, {"cache.name": self.name, "cache.result": outcome})
+        # A caller that goes away must not cancel a load other callers are waiting on
+        return await asyncio.shield(future), outcome
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """
+        Return the cached value for ``key`` without loading it, or None
+        """
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry.stored_at > self.ttl_seconds:
+            self._remove(key)
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+        cache_metrics.requests.add(1, {"cache.name": self.name, "cache.result": "hit" if entry else "miss"})
+        return entry.value if entry is not None else None
+
+    def put(self, key: Hashable, value: V) -> None:
+        """
+        Store a value produced outside of get_or_load
+        """
+        if self.enabled:
+            self._store(key, value)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        cache_metrics.size.add(-self._bytes, {"cache.name": self.name})
+        self._bytes = 0
+        self._generation += 1
+
+    def _start_load(self, key: Hashable, loader: Callable[[], Awaitable[V]]) -> asyncio.Future:
+        generation = self._generation
+        task = asyncio.ensure_future(loader())
+        self._loading[key] = task
+
+        def _on_done(done: asyncio.Future) -> None:
+            if self._loading.get(key) is done:
+                del self._loading[key]
+            if done.cancelled() or done.exception() is not None:
+                return
+            if generation == self._generation:
+                self._store(key, done.result())
+
+        task.add_done_callback(_on_done)
+        return task
+
+    def _store(self, key: Hashable, value: V) -> None:
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        while self._entries and self._bytes + size > self.max_bytes:
+            evicted_key = next(iter(self._entries))
+            self._remove(evicted_key)
+            cache_metrics.evictions.add(1, {"cache.name": self.name})
+        self._entries[key] = _Entry(value, size, time.monotonic())
+        self._bytes += size
+        cache_metrics.size.add(size, {"cache.name": self.name})
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+            cache_metrics.size.add(-entry.size, {"cache.name": self.name})
@@ -0,0 +1,523 @@
+import asyncio
+import itertools
+import logging
+import os
+import ssl
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional, TypeVar
+from pydantic import BaseModel, Field
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.engine import Connection, Engine, Row
+from sqlalchemy.exc import DBAPIError, InterfaceError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+from sqlalchemy.pool import Pool
+from sqlalchemy.sql import Executable
+from opentelemetry import metrics, trace
+from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+
+logger = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+
+T = TypeVar("T")
+
+# Replication lag in seconds; 0 when the server is not a standby or has replayed
+# everything it received, so an idle primary does not look like a lagging replica
+REPLICA_LAG = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+# How reads pick among healthy replicas:
+#   round_robin  - in turn
+#   least_loaded - the one with the fewest connections checked out of its pool
+READ_ROUTING = ("round_robin", "least_loaded")
+
+def _env_flag(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes")
+
+class PoolSettings(BaseModel):
+    """Connection pool settings for the database engine"""
+    pool_size: int = Field(default=5, ge=1)
+    max_overflow: int = Field(default=10, ge=0)
+    pool_timeout: float = Field(default=30, gt=0)
+    pool_recycle: int = Field(default=1800)
+    pool_pre_ping: bool = Field(default=True)
+    warm_connections: int = Field(default=5, ge=0)
+
+    @classmethod
+    def from_env(cls) -> "PoolSettings":
+        """
+        Build pool settings from DB_POOL_* environment variables
+        """
+        pool_size = int(os.getenv("DB_POOL_SIZE", 5))
+        return cls(
+            pool_size=pool_size,
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 10)),
+            pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", 30)),
+            pool_recycle=int(os.getenv("DB_POOL_RECYCLE", 1800)),
+            pool_pre_ping=_env_flag("DB_POOL_PRE_PING", True),
+            warm_connections=min(int(os.getenv("DB_POOL_WARM", pool_size)), pool_size)
+        )
+
+    def engine_kwargs(self) -> dict:
+        return self.model_dump(exclude={"warm_connections"})
+
+class PoolMetrics:
+    """
+    OpenTelemetry instruments describing a connection pool
+    """
+    def __init__(self):
+        self.wait_time = meter.create_histogram(
+            "db.client.connections.wait_time",
+            unit="ms",
+            description="Time spent waiting to check a connection out of the pool"
+        )
+        self.overflow = meter.create_counter(
+            "db.client.connections.overflow",
+            description="Connections opened beyond pool_size"
+        )
+        self.timeouts = meter.create_counter(
+            "db.client.connections.timeouts",
+            description="Checkouts that gave up after pool_timeout"
+        )
+
+    def watch(self, name: str, pool: Pool) -> None:
+        """
+        Start reporting overflow on ``pool`` under the ``pool.name`` attribute.
+        Connections in use are already reported by the SQLAlchemy instrumentation
+        as ``db.client.connections.usage``.
+        """
+        @event.listens_for(pool, "connect")
+        def _on_connect(dbapi_connection, connection_record):
+            if pool.overflow() > 0:
+                self.overflow.add(1, {"pool.name": name})
+
+pool_metrics = PoolMetrics()
+
+def _driver_url(db_url: str, driver: str) -> str:
+    """
+    Rewrite a plain postgresql:// URL to use the given SQLAlchemy driver
+    """
+    if db_url.startswith("postgresql://"):
+        return db_url.replace("postgresql://", f"postgresql+{driver}://", 1)
+    return db_url
+
+def _with_statement_cache(db_url: str, size: int) -> str:
+    """
+    Set the size of asyncpg's per-connection prepared statement cache. Every
+    search shape is its own statement, so the default of 100 is too small to
+    keep the common ones prepared.
+    """
+    return make_url(db_url).update_query_dict({"prepared_statement_cache_size": str(size)}) \
+        .render_as_string(hide_password=False)
+
+def _node_name(db_url: str) -> str:
+    url = make_url(db_url)
+    return f"{url.host or 'localhost'}:{url.port or 5432}"
+
+def _is_connection_error(e: Exception) -> bool:
+    """
+    Whether an error means the server could not be reached, as opposed to a failing query
+    """
+    if isinstance(e, (PoolTimeoutError, InterfaceError, OSError)):
+        return True
+    return isinstance(e, DBAPIError) and (e.connection_invalidated or isinstance(e.orig, OSError))
+
+def _asyncpg_available() -> bool:
+    try:
+        import asyncpg  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+class DatabaseNode:
+    """
+    One Postgres server: its engine and, for read replicas, the latest health check
+    """
+    def __init__(self, name: str, async_engine: Optional[AsyncEngine] = None,
+                 sync_engine: Optional[Engine] = None):
+        self.name = name
+        self.async_engine = async_engine
+        self.sync_engine = sync_engine
+        self.healthy = True
+        self.lag_seconds: Optional[float] = None
+
+    @property
+    def pool(self) -> Pool:
+        return self.async_engine.sync_engine.pool if self.async_engine is not None else self.sync_engine.pool
+
+class Database:
+    """
+    Connection management for the documents database.
+
+    Queries are written against the synchronous SQLAlchemy ``Connection`` API
+    and handed to ``run``. With the native asyncio engine (asyncpg) they are
+    executed through ``AsyncConnection.run_sync`` so every round-trip yields to
+    the event loop; the synchronous pg8000 engine is kept as a fallback and is
+    driven from a worker thread.
+
+    Calls made with ``read_only=True`` are spread over the read replicas in
+    ``DATABASE_READ_URLS``. Replicas that cannot be reached or lag behind by more
+    than ``DATABASE_REPLICA_MAX_LAG`` seconds are skipped until a later health
+    check finds them caught up; reads go to the primary when no replica is healthy.
+    """
+    def __init__(self, pool_settings: Optional[PoolSettings] = None):
+        """
+        Initialize the database engines
+        """
+        self.pool_settings = pool_settings or PoolSettings.from_env()
+        db_url = os.getenv("DATABASE_URL")
+        if not db_url:
+            raise ValueError("DATABASE_URL environment variable is not set")
+        read_urls = [url.strip() for url in os.getenv("DATABASE_READ_URLS", "").split(",") if url.strip()]
+
+        self.read_routing = os.getenv("DATABASE_READ_ROUTING", "round_robin")
+        if self.read_routing not in READ_ROUTING:
+            raise ValueError(f"Unsupported DATABASE_READ_ROUTING: {self.read_routing}")
+        self.replica_max_lag = float(os.getenv("DATABASE_REPLICA_MAX_LAG", 10))
+        self.replica_check_interval = float(os.getenv("DATABASE_REPLICA_CHECK_INTERVAL", 5))
+
+        use_async = _env_flag("DATABASE_ASYNC", True)
+        if use_async and not _asyncpg_available():
+            logger.warning("DATABASE_ASYNC is enabled but asyncpg is not installed, using the sync engine")
+            use_async = False
+
+        self.primary = self._create_node("primary", db_url, use_async)
+        self.replicas = [self._create_node(_node_name(url), url, use_async) for url in read_urls]
+        # One call for every engine: the instrumentor ignores later instrument() calls
+        SQLAlchemyInstrumentor().instrument(engines=[
+            node.async_engine.sync_engine if node.async_engine is not None else node.sync_engine
+            for node in self.nodes
+        ])
+        self._round_robin = itertools.count()
+        self._monitor: Optional[asyncio.Task] = None
+
+        # The primary's engines, for callers that need the engine itself
+        self.async_engine: Optional[AsyncEngine] = self.primary.async_engine
+        self.sync_engine: Optional[Engine] = self.primary.sync_engine
+
+    def _create_node(self, name: str, db_url: str, use_async: bool) -> DatabaseNode:
+        # ignore the certificate checks for now
+        ctx = ssl.create_default_context()
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+
+        if use_async:
+            statement_cache_size = int(os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", 500))
+            async_engine = create_async_engine(
+                _with_statement_cache(_driver_url(db_url, "asyncpg"), statement_cache_size),
+                connect_args={"ssl": ctx},
+                **self.pool_settings.engine_kwargs()
+            )
+            node = DatabaseNode(name, async_engine=async_engine)
+        else:
+            sync_engine = create_engine(
+                _driver_url(db_url, "pg8000"),
+                # pg8000 names it ssl_context; asyncpg takes ssl
+                connect_args={"ssl_context": ctx},
+                **self.pool_settings.engine_kwargs()
+            )
+            node = DatabaseNode(name, sync_engine=sync_engine)
+        pool_metrics.watch(name, node.pool)
+        return node
+
+    @property
+    def nodes(self) -> List[DatabaseNode]:
+        return [self.primary, *self.replicas]
+
+    @property
+    def is_async(self) -> bool:
+        return self.async_engine is not None
+
+    @property
+    def percent(self) -> str:
+        """
+        A literal % as it has to be written in text() SQL: pg8000 uses the
+        format paramstyle and needs it doubled, asyncpg takes it as is
+        """
+        return "%" if self.is_async else "%%"
+
+    async def run(self, fn: Callable[..., T], *args: Any, read_only: bool = False) -> T:
+        """
+        Run ``fn(conn, *args)`` on a pooled connection without blocking the event loop
+
+        Args:
+            fn: Callable taking a synchronous SQLAlchemy Connection as first argument
+            *args: Extra positional arguments passed to ``fn``
+            read_only: ``fn`` only reads and may run on a read replica
+
+        Returns:
+            Whatever ``fn`` returns
+        """
+        node = self._route(read_only)
+        if node.async_engine is not None:
+            async with self._checkout_async(node, read_only) as conn:
+                return await conn.run_sync(fn, *args)
+        return await asyncio.to_thread(self._run_sync, node, read_only, fn, *args)
+
+    def _run_sync(self, node: DatabaseNode, read_only: bool, fn: Callable[..., T], *args: Any) -> T:
+        with self._checkout_sync(node, read_only) as conn:
+            return fn(conn, *args)
+
+    def _route(self, read_only: bool) -> DatabaseNode:
+        """
+        The node a call should run on: a healthy replica for reads when there is one,
+        otherwise the primary
+        """
+        if not read_only:
+            return self.primary
+        healthy = [node for node in self.replicas if node.healthy]
+        if not healthy:
+            return self.primary
+        if self.read_routing == "least_loaded":
+            return min(healthy, key=lambda node: node.pool.checkedout())
+        return healthy[next(self._round_robin) % len(healthy)]
+
+    def _served_by(self, node: DatabaseNode, read_only: bool) -> None:
+        if read_only and self.replicas:
+            trace.get_current_span().set_attribute("db.replica", node.name)
+
+    def _replica_failed(self, node: DatabaseNode, error: Exception) -> DatabaseNode:
+        """
+        Take an unreachable replica out of rotation until the next health check
+        Returns the primary, to retry on
+        """
+        if node.healthy:
+            logger.warning(f"read replica {node.name} is unreachable, reading from the primary: {error}")
+        node.healthy = False
+        return self.primary
+
+    @asynccontextmanager
+    async def _checkout_async(self, node: DatabaseNode, read_only: bool = False) -> AsyncIterator[AsyncConnection]:
+        conn = await self._connect_async(node, read_only)
+        try:
+            yield conn
+        finally:
+            await conn.close()
+
+    async def _connect_async(self, node: DatabaseNode, read_only: bool = False) -> AsyncConnection:
+        try:
+            conn = await self._open_async(node)
+        except Exception as e:
+            if not read_only or node is self.primary or not _is_connection_error(e):
+                raise
+            node = self._replica_failed(node, e)
+            conn = await self._open_async(node)
+        self._served_by(node, read_only)
+        return conn
+
+    async def _open_async(self, node: DatabaseNode) -> AsyncConnection:
+        start = time.perf_counter()
+        try:
+            conn = await node.async_engine.connect()
+        except PoolTimeoutError:
+            pool_metrics.timeouts.add(1, {"pool.name": node.name})
+            raise
+        pool_metrics.wait_time.record((time.perf_counter() - start) * 1000, {"pool.name": node.name})
+        return conn
+
+    @contextmanager
+    def _checkout_sync(self, node: DatabaseNode, read_only: bool = False) -> Iterator[Connection]:
+        with self._connect_sync(node, read_only) as conn:
+            yield conn
+
+    def _connect_sync(self, node: DatabaseNode, read_only: bool = False) -> Connection:
+        try:
+            conn = self._open_sync(node)
+        except Exception as e:
+            if not read_only or node is self.primary or not _is_connection_error(e):
+                raise
+            node = self._replica_failed(node, e)
+            conn = self._open_sync(node)
+        self._served_by(node, read_only)
+        return conn
+
+    def _open_sync(self, node: DatabaseNode) -> Connection:
+        start = time.perf_counter()
+        try:
+            conn = node.sync_engine.connect()
+        except PoolTimeoutError:
+            pool_metrics.timeouts.add(1, {"pool.name": node.name})
+            raise
+        pool_metrics.wait_time.record((time.perf_counter() - start) * 1000, {"pool.name": node.name})
+        return conn
+
+    async def stream(self, statement: Executable, params: dict, batch_size: int,
+                     setup: Optional[Callable[[Connection], Any]] = None,
+                     read_only: bool = False) -> AsyncIterator[List[Row]]:
+        """
+        Execute ``statement`` and yield its rows in batches of up to ``batch_size``
+
+        The rows are read through a server-side cursor, so only one batch is held
+        in memory at a time. With pg8000, SQLAlchemy declares the cursor and fetches
+        from it for ``stream_results``; each fetch runs in a worker thread so it does
+        not block the event loop.
+        Closing the generator early (for example when the task is cancelled) closes
+        the cursor and returns the connection to the pool.
+
+        Args:
+            statement: Statement to execute
+            params: Bind parameters
+            batch_size: Rows fetched per round-trip
+            setup: Optional callable run on the synchronous Connection before the statement
+            read_only: The statement only reads and may run on a read replica
+        """
+        node = self._route(read_only)
+        if node.async_engine is not None:
+            async with self._checkout_async(node, read_only) as conn:
+                if setup is not None:
+                    await conn.run_sync(setup)
+                result = await conn.stream(statement, params, execution_options={"yield_per": batch_size})
+                try:
+                    async for batch in result.partitions(batch_size):
+                        yield batch
+                finally:
+                    await result.close()
+            return
+
+        worker: Optional[asyncio.Future] = None
+
+        async def in_thread(fn: Callable[..., T], *args: Any) -> T:
+            # Shielded, so a cancelled stream can wait for the worker thread to be
+            # done with the connection before closing it
+            nonlocal worker
+            worker = asyncio.ensure_future(asyncio.to_thread(fn, *args))
+            return await asyncio.shield(worker)
+
+        conn = None
+        try:
+            conn = await in_thread(self._connect_sync, node, read_only)
+            if setup is not None:
+                await in_thread(setup, conn)
+            result = await in_thread(
+                conn.execution_options(stream_results=True, yield_per=batch_size).execute, statement, params
+            )
+            while True:
+                batch = await in_thread(result.fetchmany, batch_size)
+                if not batch:
+                    break
+                yield batch
+        finally:
+            if worker is not None:
+                await asyncio.wait([worker])
+                if conn is None and worker.exception() is None:
+                    # Cancelled while connecting; the connection arrived afterwards
+                    conn = worker.result()
+            if conn is not None:
+                await asyncio.to_thread(conn.close)
+
+    async def warm_pool(self) -> None:
+        """
+        Open ``warm_connections`` connections to every node up front so the first
+        requests after startup do not pay for connection setup and TLS handshakes
+        """
+        count = self.pool_settings.warm_connections
+        if count <= 0:
+            return
+        await asyncio.gather(*(self._warm_node(node, count) for node in self.nodes))
+
+    async def _warm_node(self, node: DatabaseNode, count: int) -> None:
+        start = time.perf_counter()
+        if node.async_engine is not None:
+            results = await asyncio.gather(
+                *(node.async_engine.connect() for _ in range(count)),
+                return_exceptions=True
+            )
+            errors = [r for r in results if isinstance(r, BaseException)]
+            for conn in results:
+                if isinstance(conn, AsyncConnection):
+                    await conn.close()
+        else:
+            errors = await asyncio.to_thread(self._warm_sync, node.sync_engine, count)
+
+        if errors:
+            # Startup should not fail because the database is briefly unreachable;
+            # the pool will keep connecting lazily
+            logger.warning(f"could not warm database pool {node.name}: {errors[0]}")
+        else:
+            logger.info(
+                f"warmed database pool {node.name} with {count} connections "
+                f"in {(time.perf_counter() - start) * 1000:.0f} ms"
+            )
+
+    @staticmethod
+    def _warm_sync(engine: Engine, count: int) -> list[Exception]:
+        conns, errors = [], []
+        for _ in range(count):
+            try:
+                conns.append(engine.connect())
+            except Exception as e:
+                errors.append(e)
+        for conn in conns:
+            conn.close()
+        return errors
+
+    async def start(self) -> None:
+        """
+        Check the read replicas now, then every ``replica_check_interval`` seconds
+        """
+        if not self.replicas or self._monitor is not None:
+            return
+        await self.check_replicas()
+        if self.replica_check_interval > 0:
+            self._monitor = asyncio.create_task(self._monitor_replicas())
+
+    async def _monitor_replicas(self) -> None:
+        while True:
+            await asyncio.sleep(self.replica_check_interval)
+            await self.check_replicas()
+
+    async def check_replicas(self) -> None:
+        """
+        Measure each replica's replication lag and take it out of rotation while it is
+        unreachable or more than ``replica_max_lag`` seconds behind
+        """
+        await asyncio.gather(*(self._check_replica(node) for node in self.replicas))
+
+    async def _check_replica(self, node: DatabaseNode) -> None:
+        try:
+            if node.async_engine is not None:
+                async with self._checkout_async(node) as conn:
+                    lag = await conn.run_sync(self._execute_replica_lag)
+            else:
+                lag = await asyncio.to_thread(self._run_sync, node, False, self._execute_replica_lag)
+        except Exception as e:
+            if node.healthy:
+                logger.warning(f"read replica {node.name} failed its health check: {e}")
+            node.healthy = False
+            node.lag_seconds = None
+            return
+
+        node.lag_seconds = lag
+        healthy = lag <= self.replica_max_lag
+        if healthy and not node.healthy:
+            logger.info(f"read replica {node.name} is back in rotation, {lag:.1f}s behind")
+        elif not healthy and node.healthy:
+            logger.warning(f"read replica {node.name} is {lag:.1f}s behind, reading from other nodes")
+        node.healthy = healthy
+
+    @staticmethod
+    def _execute_replica_lag(conn: Connection) -> float:
+        return float(conn.execute(REPLICA_LAG).scalar())
+
+    async def dispose(self) -> None:
+        """
+        Stop checking replicas and close all pooled connections
+        """
+        if self._monitor is not None:
+            self._monitor.cancel()
+            try:
+                await self._monitor
+            except asyncio.CancelledError:
+                pass
+            self._monitor = None
+        for node in self.nodes:
+            if node.async_engine is not None:
+                await node.async_engine.dispose()
+            if node.sync_engine is not None:
+                node.sync_engine.dispose()
@@ -0,0 +1,11 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    The datetime as naive UTC, for comparing with timestamp without time zone
+    columns such as documents.created_at. Naive values are returned unchanged.
+    """
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
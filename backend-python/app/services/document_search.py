@@ -1,141 +1,925 @@
-from typing import List, Optional
+import asyncio
+import base64
+import binascii
+import bisect
+import hashlib
+import json
+import logging
 import os
-import ssl
-from sqlalchemy import create_engine, text
+import time
+from contextlib import aclosing
+from datetime import date, datetime
+from functools import lru_cache, partial
+from typing import Any, AsyncIterator, Callable, List, NamedTuple, Optional, TypeVar
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Row
 from sqlalchemy.exc import SQLAlchemyError
-from ..models import Document, DocumentSearchRequest
-from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+from sqlalchemy.sql.elements import TextClause
+from ..models import (
+    CountMode, Document, DocumentExportRequest, DocumentFacetsRequest, DocumentSearchRequest, FacetCount, FacetField, SearchMode
+)
+from .batcher import BatchLoader
+from .cache import LoadingCache, TTLCache
+from .database import Database, _env_flag
+from .dates import to_naive_utc
+from .memory_index import IndexFilters, MemoryIndex, tokenize
 from opentelemetry import trace
 
 tracer = trace.get_tracer(__name__)
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Select expression for each Document field
+DOCUMENT_COLUMNS = {
+    "id": "id",
+    "title": "title",
+    "document_date": "docdt as document_date",
+    "abstract": "abstract",
+    "document_type": "docty as document_type",
+    "major_document_type": "majdocty as major_document_type",
+    "volume_number": "volnb as volume_number",
+    "total_volume_number": "totvolnb as total_volume_number",
+    "url": "url",
+    "language": "lang as language",
+    "country": "country",
+    "author": "author",
+    "publisher": "publisher",
+    "created_at": "created_at",
+    "updated_at": "updated_at",
+}
+
+SELECT_COLUMNS = ", ".join(DOCUMENT_COLUMNS.values())
+
+# How result_count is obtained alongside the page of results:
+#   single     - one statement joining a COUNT(*) subquery to the LIMITed page, so each
+#                side keeps its own plan (index-only count, early-stopping page)
+#   window     - one statement with COUNT(*) OVER (); every match is read in full before LIMIT
+#   parallel   - separate COUNT and page queries on two pooled connections at once
+#   sequential - separate COUNT and page queries on one connection
+COUNT_STRATEGIES = ("single", "window", "parallel", "sequential")
+
+# Must match the configuration used for documents.search_vector in 00-schema.sql
+# so the GIN index can serve full-text queries
+TEXT_SEARCH_CONFIG = "english"
+
+# Optional filters as (request field, bind parameter, condition), in bit order.
+# The filters present in a request form a bit mask, and each mask (together with
+# the search mode and whether a cursor is given) maps to one set of prebuilt statements
+FILTERS = (
+    ("title", "title", "title ILIKE :title"),
+    ("abstract", "abstract", "abstract ILIKE :abstract"),
+    ("doc_type", "document_type", "docty = :document_type"),
+    ("major_document_type", "major_document_type", "majdocty = :major_document_type"),
+    ("language", "language", "lang = :language"),
+    ("country", "country", "country = :country"),
+    ("start_date", "start_date", "created_at >= :start_date"),
+    ("end_date", "end_date", "created_at <= :end_date"),
+)
+LIKE_FILTERS = {"title", "abstract"}
+
+# Column behind each facet; the document_facets materialized view in 00-schema.sql
+# holds the same counts for the unfiltered corpus
+FACET_COLUMNS = {
+    FacetField.COUNTRY: "country",
+    FacetField.LANGUAGE: "lang",
+    FacetField.DOCUMENT_TYPE: "docty",
+    FacetField.MAJOR_DOCUMENT_TYPE: "majdocty",
+}
+
+SET_CONFIG = text("SELECT set_config(:name, :value, true)")
+LATEST_UPDATE = text("SELECT MAX(updated_at) FROM documents")
+CORPUS_FACETS = text("SELECT facet, value, count FROM document_facets WHERE facet = ANY(:facets)")
+REFRESH_FACETS = text("REFRESH MATERIALIZED VIEW CONCURRENTLY document_facets")
+
+class QueryShape(NamedTuple):
+    """Everything that decides the SQL text of a search; values are always bound"""
+    id_lookup: bool
+    search_mode: Optional[SearchMode]
+    filter_mask: int
+    cursor: bool
+    # Selected Document fields in DOCUMENT_COLUMNS order, or None for all of them
+    fields: Optional[tuple[str, ...]] = None
+
+class SearchStatements(NamedTuple):
+    where: str
+    page: TextClause
+    count: TextClause
+    combined: TextClause
+    capped_count: TextClause
+    capped_combined: TextClause
+    explain: TextClause
+    window: Optional[TextClause]
+
+@lru_cache(maxsize=4096)
+def _build_statements(shape: QueryShape, percent: str) -> SearchStatements:
+    """
+    Build the statements for one query shape. Results are cached, so the SQL text
+    for a shape is assembled once per process, and every request of that shape
+    sends identical text that the driver can keep prepared per connection.
+    LIMITs are bound as :limit (page) and :count_limit (capped count).
+    """
+    where = " WHERE 1=1"
+    # Ranked modes order by a sort_key column (ascending, ties broken by id)
+    # that both the inner page query and the outer combined query can
+    # refer to by name; everything else is ordered by the primary key
+    sort_key = None
+    if shape.id_lookup:
+        where += " AND id = :id"
+    else:
+        if shape.search_mode == SearchMode.FULLTEXT:
+            tsquery = f"websearch_to_tsquery('{TEXT_SEARCH_CONFIG}', :search_text)"
+            where += f" AND search_vector @@ {tsquery}"
+            sort_key = f"-ts_rank(search_vector, {tsquery})"
+        elif shape.search_mode == SearchMode.FUZZY:
+            # <% uses the GIN trigram indexes with word_similarity_threshold.
+            # Rows are ordered by the nearer of the two <<-> distances (LEAST
+            # skips a NULL abstract), so an abstract match ranks by how well it
+            # matched. No index can return that order, so every match is sorted.
+            word_match = f"<{percent}"
+            where += f" AND ( CAST(:search_text AS text) {word_match} title OR CAST(:search_text AS text) {word_match} abstract )"
+            sort_key = "LEAST(CAST(:search_text AS text) <<-> title, CAST(:search_text AS text) <<-> abstract)"
+        elif shape.search_mode is not None:
+            where += " AND ( title ILIKE :search_text OR abstract ILIKE :search_text )"
+        for bit, (_, _, condition) in enumerate(FILTERS):
+            if shape.filter_mask & (1 << bit):
+                where += f" AND {condition}"
+
+    sort_column = ""
+    order_by = " ORDER BY id"
+    if sort_key:
+        sort_column = f", {sort_key} AS sort_key"
+        order_by = " ORDER BY sort_key, id"
+
+    page_where = where
+    if shape.cursor:
+        if sort_key:
+            page_where += f" AND ({sort_key}, id) > (:cursor_sort_key, :cursor_id)"
+        else:
+            page_where += " AND id > :cursor_id"
+
+    columns = SELECT_COLUMNS
+    if shape.fields is not None:
+        columns = ", ".join(DOCUMENT_COLUMNS[field] for field in shape.fields)
+
+    page = f"SELECT {columns}{sort_column} FROM documents{page_where}{order_by} LIMIT :limit"
+    count = f"SELECT COUNT(*) AS total_count FROM documents{where}"
+    capped_count = f"SELECT COUNT(*) AS total_count FROM (SELECT 1 FROM documents{where} LIMIT :count_limit) AS capped"
+    # A window count would only see rows after the cursor
+    window = None if shape.cursor else text(
+        f"SELECT {columns}{sort_column}, COUNT(*) OVER () AS total_count "
+        f"FROM documents{where}{order_by} LIMIT :limit"
+    )
+    return SearchStatements(
+        where=where,
+        page=text(page),
+        count=text(count),
+        combined=text(_combined_sql(count, page, order_by)),
+        capped_count=text(capped_count),
+        capped_combined=text(_combined_sql(capped_count, page, order_by)),
+        explain=text(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM documents{where}"),
+        window=window
+    )
+
+@lru_cache(maxsize=1024)
+def _build_facet_statement(shape: QueryShape, facets: tuple[FacetField, ...], percent: str) -> TextClause:
+    """
+    Build one GROUPING SETS statement counting every requested facet over the
+    documents matching a query shape, returning (facet, value, count) rows
+    """
+    where = _build_statements(shape, percent).where
+    columns = [FACET_COLUMNS[facet] for facet in facets]
+    # Each grouping set groups by a single column, so exactly one column is not
+    # aggregated away in every row: GROUPING() names it and COALESCE picks its value
+    facet_name = " ".join(f"WHEN GROUPING({column}) = 0 THEN '{facet.value}'" for facet, column in zip(facets, columns))
+    grouping_sets = ", ".join(f"({column})" for column in columns)
+    return text(f"""
+        SELECT facet, value, count FROM (
+            SELECT CASE {facet_name} END AS facet, COALESCE({", ".join(columns)}) AS value, COUNT(*) AS count
+            FROM documents{where}
+            GROUP BY GROUPING SETS ({grouping_sets})
+        ) AS grouped
+        WHERE value IS NOT NULL
+    """)
+
+@lru_cache(maxsize=None)
+def _documents_by_id_statement(fields: Optional[tuple[str, ...]]) -> TextClause:
+    columns = SELECT_COLUMNS if fields is None else ", ".join(DOCUMENT_COLUMNS[field] for field in fields)
+    return text(f"SELECT {columns} FROM documents WHERE id = ANY(:ids)")
+
+def _combined_sql(count_query: str, page_query: str, order_by: str) -> str:
+    # The count row is always present; page columns are NULL when nothing matches
+    return f"""
+        SELECT page.*, counted.total_count
+        FROM ({count_query}) AS counted
+        LEFT JOIN ({page_query}) AS page ON true
+        {order_by}
+    """
+
+def _as_datetime(value: Any) -> Any:
+    """
+    docdt is a DATE; Document.document_date is a datetime at midnight
+    """
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime.combine(value, datetime.min.time())
+    return value
+
+class SearchResult(NamedTuple):
+    total_count: int
+    documents: List[Document]
+    count_mode: CountMode = CountMode.EXACT
+    next_cursor: Optional[str] = None
 
 class DocumentSearchService:
     """
     Service for searching documents in the PostgreSQL database
     """
-    def __init__(self):
+    def __init__(self, database: Optional[Database] = None, count_strategy: Optional[str] = None):
         """
         Initialize the database connection
         """
-        # ignore the certificate checks for now
-        ctx = ssl.create_default_context()
-        ctx.check_hostname = False
-        ctx.verify_mode = ssl.CERT_NONE
-        db_url = os.getenv("DATABASE_URL")
-        if not db_url:
-            raise ValueError("DATABASE_URL environment variable is not set")
-        # Convert the URL to use pg8000 instead of psycopg2
-        if db_url.startswith("postgresql://"):
-            db_url = db_url.replace("postgresql://", "postgresql+pg8000://")
-        self.engine = create_engine(db_url, connect_args={"ssl": ctx})
-        SQLAlchemyInstrumentor().instrument(engine=self.engine)
+        self.database = database or Database()
+        self.count_strategy = count_strategy or os.getenv("SEARCH_COUNT_STRATEGY", "single")
+        if self.count_strategy not in COUNT_STRATEGIES:
+            raise ValueError(f"Unsupported SEARCH_COUNT_STRATEGY: {self.count_strategy}")
+        self.default_search_mode = SearchMode(os.getenv("SEARCH_DEFAULT_MODE", SearchMode.ILIKE.value))
+        self.similarity_threshold = float(os.getenv("SEARCH_SIMILARITY_THRESHOLD", 0.3))
+        self.count_cap = int(os.getenv("SEARCH_COUNT_CAP", 10000))
+        self.count_cache: TTLCache[int] = TTLCache(
+            max_entries=int(os.getenv("SEARCH_COUNT_CACHE_SIZE", 1024)),
+            ttl_seconds=float(os.getenv("SEARCH_COUNT_CACHE_TTL", 60))
+        )
+        self.result_cache: LoadingCache[SearchResult] = LoadingCache(
+            name="search_results",
+            max_bytes=int(os.getenv("SEARCH_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+            ttl_seconds=float(os.getenv("SEARCH_CACHE_TTL", 30)),
+            refresh_ratio=float(os.getenv("SEARCH_CACHE_REFRESH_RATIO", 0.8)),
+            sizeof=self._result_size
+        )
+        self.facet_cache: LoadingCache[dict] = LoadingCache(
+            name="search_facets",
+            max_bytes=int(os.getenv("SEARCH_FACETS_CACHE_MAX_BYTES", 8 * 1024 * 1024)),
+            ttl_seconds=float(os.getenv("SEARCH_CACHE_TTL", 30)),
+            refresh_ratio=float(os.getenv("SEARCH_CACHE_REFRESH_RATIO", 0.8)),
+            sizeof=self._facets_size
+        )
+        self.document_loader: BatchLoader[str, Document] = BatchLoader(
+            name="documents",
+            load_many=self._load_documents,
+            max_batch_size=int(os.getenv("DOCUMENT_BATCH_MAX_SIZE", 64)),
+            max_wait_ms=float(os.getenv("DOCUMENT_BATCH_MAX_WAIT_MS", 2))
+        )
+        self.export_batch_size = int(os.getenv("SEARCH_EXPORT_BATCH_SIZE", 1000))
+        self.watermark_interval = float(os.getenv("SEARCH_CACHE_WATERMARK_INTERVAL", 5))
+        self.facets_refresh_interval = float(os.getenv("SEARCH_FACETS_REFRESH_INTERVAL", 300))
+        self.memory_index: Optional[MemoryIndex] = None
+        if _env_flag("SEARCH_MEMORY_INDEX", False):
+            self.memory_index = MemoryIndex(
+                self.database,
+                refresh_interval=float(os.getenv("SEARCH_MEMORY_INDEX_REFRESH_INTERVAL", 5)),
+                purge_interval=float(os.getenv("SEARCH_MEMORY_INDEX_PURGE_INTERVAL", 60))
+            )
+        self._last_update = None
+        # Watermark the document_facets view was last refreshed at; the sentinel forces
+        # a refresh at startup
+        self._facets_update: Any = object()
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        """
+        Start watching documents.updated_at so cached results are dropped when the data
+        changes, keep the document_facets view refreshed, and build the memory index
+        if it is enabled
+        """
+        if self._tasks:
+            return
+        if self.watermark_interval > 0:
+            self._tasks.append(asyncio.create_task(self._watch_updates()))
+        if self.facets_refresh_interval > 0:
+            self._tasks.append(asyncio.create_task(self._refresh_facets()))
+        if self.memory_index is not None:
+            self._tasks.append(asyncio.create_task(self.memory_index.run()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        await self.document_loader.aclose()
+
+    def invalidate(self) -> None:
+        """
+        Drop every cached search result, count and facet
+        """
+        self.result_cache.clear()
+        self.count_cache.clear()
+        self.facet_cache.clear()
+
+    async def _watch_updates(self) -> None:
+        while True:
+            try:
+                latest = await self.database.run(self._execute_latest_update)
+                if latest is not None:
+                    if self._last_update is not None and latest > self._last_update:
+                        logger.info(f"documents changed at {latest}, invalidating search caches")
+                        self.invalidate()
+                    self._last_update = latest
+            except Exception as e:
+                logger.warning(f"could not check documents.updated_at: {e}")
+            await asyncio.sleep(self.watermark_interval)
+
+    async def _refresh_facets(self) -> None:
+        """
+        Refresh the document_facets view every facets_refresh_interval seconds, skipping
+        refreshes while the documents watermark has not moved
+        """
+        while True:
+            watermark = self._last_update
+            if watermark is None or watermark != self._facets_update:
+                try:
+                    start = time.perf_counter()
+                    await self.database.run(self._execute_refresh_facets)
+                    self._facets_update = watermark
+                    self.facet_cache.clear()
+                    logger.info(f"refreshed document_facets in {(time.perf_counter() - start) * 1000:.0f} ms")
+                except Exception as e:
+                    logger.warning(f"could not refresh document_facets: {e}")
+            await asyncio.sleep(self.facets_refresh_interval)
+
+    async def search_documents(self, search_request: DocumentSearchRequest) -> SearchResult:
+        """
+        Search for documents based on the provided criteria, serving repeated
+        searches from the result cache unless the request opts out
+        Returns a SearchResult of (total_count, matching_documents, count_mode, next_cursor)
+        """
+        with tracer.start_as_current_span("search_documents") as span:
+            search_request = self._normalize_request(search_request)
+            if search_request.use_cache is False or not self.result_cache.enabled:
+                span.set_attribute("cache.result", "bypass")
+                return await self._query_documents(search_request)
+
+            cache_key = json.dumps(
+                search_request.model_dump(mode="json", exclude={"use_cache"}, exclude_none=True),
+                sort_keys=True, separators=(",", ":")
+            )
+            result, outcome = await self.result_cache.get_or_load(
+                cache_key,
+                lambda: self._query_documents(search_request)
+            )
+            span.set_attribute("cache.result", outcome)
+            return result
 
-    async def search_documents(self, search_request: DocumentSearchRequest) -> tuple[int, List[Document]]:
+    async def get_documents(self, ids: List[str],
+                            fields: Optional[tuple[str, ...]] = None) -> tuple[List[Document], List[str]]:
         """
-        Search for documents based on the provided criteria
-        Returns a tuple of (total_count, matching_documents)
+        Fetch documents by id in a single query, without counting or caching.
+        ``fields`` limits the documents to those fields, as returned by selected_fields.
+        Returns a tuple of (documents in the order their ids were first requested, missing ids)
         """
         try:
-            with tracer.start_as_current_span("search_documents") as span:
+            with tracer.start_as_current_span("get_documents") as span:
+                ids = list(dict.fromkeys(ids))
+                span.set_attribute("ids.count", len(ids))
+                rows = await self.database.run(
+                    self._execute_by_id, _documents_by_id_statement(fields), ids, read_only=True
+                )
+                found = {row.id: row for row in rows}
+                if fields is None:
+                    documents = [self._row_to_document(found[doc_id]) for doc_id in ids if doc_id in found]
+                else:
+                    documents = [
+                        self._row_to_partial_document(found[doc_id], fields) for doc_id in ids if doc_id in found
+                    ]
+                missing_ids = [doc_id for doc_id in ids if doc_id not in found]
+                span.set_attribute("ids.missing", len(missing_ids))
+                return documents, missing_ids
+
+        except SQLAlchemyError as e:
+            raise RuntimeError(f"Database error: {str(e)}")
+
+    async def get_document(self, doc_id: str) -> Optional[Document]:
+        """
+        Fetch one document by id. Lookups arriving close together are batched
+        into a single get_documents query.
+        Returns None if there is no such document
+        """
+        return await self.document_loader.load(doc_id)
+
+    async def _load_documents(self, ids: List[str]) -> dict[str, Document]:
+        documents, _ = await self.get_documents(ids)
+        return {document.id: document for document in documents}
+
+    async def facet_documents(self, facets_request: DocumentFacetsRequest) -> dict[str, List[FacetCount]]:
+        """
+        Count the documents matching a search by each requested facet field,
+        serving repeated requests from the facet cache unless the request opts out
+        Returns a dict of facet name to counts, most frequent value first
+        """
+        with tracer.start_as_current_span("facet_documents") as span:
+            facets_request = self._normalize_request(facets_request)
+            if facets_request.use_cache is False or not self.facet_cache.enabled:
+                span.set_attribute("cache.result", "bypass")
+                return await self._query_facets(facets_request)
+
+            cache_key = json.dumps(
+                facets_request.model_dump(
+                    mode="json", exclude_none=True,
+                    exclude={"use_cache", "cursor", "max_results", "count_mode", "count_cap"}
+                ),
+                sort_keys=True, separators=(",", ":")
+            )
+            result, outcome = await self.facet_cache.get_or_load(
+                cache_key,
+                lambda: self._query_facets(facets_request)
+            )
+            span.set_attribute("cache.result", outcome)
+            return result
+
+    async def export_documents(self, export_request: DocumentExportRequest) -> AsyncIterator[List[Document]]:
+        """
+        Stream every document matching a search in batches of export_batch_size,
+        in the same order as search results, bypassing the caches
+        """
+        export_request = self._normalize_request(export_request)
+        with tracer.start_as_current_span("export_documents") as span:
+            span.set_attribute("search_request", export_request.model_dump_json())
+            span.set_attribute("export.format", export_request.format.value)
+            search_mode, filter_mask, params, settings = self._bind_filters(export_request, span)
+            fields = self.selected_fields(export_request)
+            shape = QueryShape(bool(export_request.id), search_mode, filter_mask, False, fields)
+            # LIMIT NULL exports every match
+            params["limit"] = export_request.max_results
+            statement = _build_statements(shape, self.database.percent).page
+
+            exported = 0
+            try:
+                setup = partial(self._apply_settings, settings=settings) if settings else None
+                # aclosing: leaving this generator early must close the cursor right away
+                async with aclosing(
+                    self.database.stream(statement, params, self.export_batch_size, setup, read_only=True)
+                ) as batches:
+                    async for rows in batches:
+                        if fields is None:
+                            documents = [self._row_to_document(row) for row in rows]
+                        else:
+                            documents = [self._row_to_partial_document(row, fields) for row in rows]
+                        exported += len(documents)
+                        yield documents
+            except (asyncio.CancelledError, GeneratorExit):
+                # The client went away; leaving the stream closes the cursor
+                span.set_attribute("export.cancelled", True)
+                raise
+            except SQLAlchemyError as e:
+                raise RuntimeError(f"Database error: {str(e)}")
+            finally:
+                span.set_attribute("export.rows", exported)
+
+    @staticmethod
+    def _normalize_request(search_request: DocumentSearchRequest) -> DocumentSearchRequest:
+        """
+        Canonical form of a search request, so equivalent searches share a cache entry:
+        free text is trimmed, whitespace-collapsed and case-folded (every text mode is
+        case-insensitive)
+        """
+        updates = {}
+        for name in ("search_text", "title", "abstract"):
+            value = getattr(search_request, name)
+            if value is not None:
+                updates[name] = " ".join(value.split()).casefold() or None
+        return search_request.model_copy(update=updates) if updates else search_request
+
+    @staticmethod
+    def _result_size(result: SearchResult) -> int:
+        # Estimated from the text fields, so filling the cache does not serialize every document
+        return 128 + sum(
+            64 + sum(len(value) for value in vars(document).values() if isinstance(value, str))
+            for document in result.documents
+        )
+
+    @staticmethod
+    def _facets_size(facets: dict[str, List[FacetCount]]) -> int:
+        return 128 + sum(64 + len(count.value) for counts in facets.values() for count in counts)
+
+    async def _query_documents(self, search_request: DocumentSearchRequest) -> SearchResult:
+        """
+        Run a search against the database
+        """
+        try:
+            with tracer.start_as_current_span("query_documents") as span:
                 span.set_attribute("search_request", search_request.model_dump_json())
-                
-                # Build the base query
-                query = """
-                    SELECT 
-                        id, title, docdt as document_date, abstract, docty as document_type,
-                        majdocty as major_document_type, volnb as volume_number, totvolnb as total_volume_number,
-                        url, lang as language, country, author, publisher,
-                        created_at, updated_at
-                    FROM documents
-                    WHERE 1=1
-                """
-                params = {}
-                
-                # Add search conditions. In case the id is provided, we don't need to search by other criteria.
-                if search_request.id:
-                    query += " AND id = :id"
-                    params["id"] = search_request.id
-                    span.set_attribute("id", search_request.id)
+
+                if self._use_memory_index(search_request, span):
+                    return await self._query_memory_index(search_request, span)
+
+                search_mode, filter_mask, params, settings = self._bind_filters(search_request, span)
+
+                count_mode = search_request.count_mode or CountMode.EXACT
+                span.set_attribute("db.async", self.database.is_async)
+                span.set_attribute("count_strategy", self.count_strategy)
+                span.set_attribute("count_mode", count_mode.value)
+                span.set_attribute("filter_mask", filter_mask)
+
+                fields = self.selected_fields(search_request)
+                shape = QueryShape(
+                    bool(search_request.id), search_mode, filter_mask, bool(search_request.cursor), fields
+                )
+                statements = _build_statements(shape, self.database.percent)
+
+                # Counts cover the whole filter; only the page query continues after the cursor
+                count_key = (statements.where, tuple(sorted(params.items())), tuple(sorted(settings.items())))
+                filter_key = hashlib.sha1(repr(count_key).encode()).hexdigest()[:16]
+                if search_request.cursor:
+                    params["cursor_sort_key"], params["cursor_id"] = self._decode_cursor(
+                        search_request.cursor, filter_key,
+                        ranked=not shape.id_lookup and search_mode in (SearchMode.FULLTEXT, SearchMode.FUZZY)
+                    )
+                    span.set_attribute("cursor", True)
+
+                # One row past the page tells us whether there is a next page
+                params["limit"] = search_request.max_results + 1
+
+                if count_mode == CountMode.ESTIMATED:
+                    total_count, rows = await self._run(
+                        settings, self._execute_estimated, statements.explain, statements.page, params
+                    )
+                elif count_mode == CountMode.CAPPED:
+                    cap = search_request.count_cap or self.count_cap
+                    params["count_limit"] = cap + 1
+                    total_count, rows = await self._fetch_with_count(
+                        statements.capped_count, statements.page, statements.capped_combined, params, settings
+                    )
+                    if total_count > cap:
+                        total_count = cap
+                    else:
+                        # Fewer matches than the cap, so the count is exact
+                        count_mode = CountMode.EXACT
                 else:
-                    if search_request.search_text:
-                        query += " AND ( title ILIKE :search_text OR abstract ILIKE :search_text )"
-                        params["search_text"] = f"%{search_request.search_text}%"
-                        span.set_attribute("search_text", search_request.search_text)
-
-                    if search_request.title:
-                        query += " AND title ILIKE :title"
-                        params["title"] = f"%{search_request.title}%"
-                        span.set_attribute("title", search_request.title)
-                    
-                    if search_request.abstract:
-                        query += " AND abstract ILIKE :abstract"
-                        params["abstract"] = f"%{search_request.abstract}%"
-                        span.set_attribute("abstract", search_request.abstract)
-                    
-                    if search_request.doc_type:
-                        query += " AND docty = :document_type"
-                        params["document_type"] = search_request.doc_type
-                        span.set_attribute("document_type", search_request.doc_type)
-                    
-                    if search_request.major_document_type:
-                        query += " AND majdocty = :major_document_type"
-                        params["major_document_type"] = search_request.major_document_type
-                        span.set_attribute("major_document_type", search_request.major_document_type)
-                    
-                    if search_request.language:
-                        query += " AND lang = :language"
-                        params["language"] = search_request.language
-                        span.set_attribute("language", search_request.language)
-                    
-                    if search_request.country:
-                        query += " AND country = :country"
-                        params["country"] = search_request.country
-                        span.set_attribute("country", search_request.country)
-
-                    if search_request.start_date:
-                        query += " AND created_at >= :start_date"
-                        params["start_date"] = search_request.start_date
-                        span.set_attribute("start_date", search_request.start_date)
-                    
-                    if search_request.end_date:
-                        query += " AND created_at <= :end_date"
-                        params["end_date"] = search_request.end_date
-                        span.set_attribute("end_date", search_request.end_date)
-
-                # Get total count
-                count_query = f"SELECT COUNT(*) FROM ({query}) as subquery"
-                
-                # Add limit to the main query
-                query += f" LIMIT {search_request.max_results}"
-
-                with self.engine.connect() as conn:
-                    # Get total count
-                    total_count = conn.execute(text(count_query), params).scalar()
-
-                    # Get matching documents
-                    result = conn.execute(text(query), params)
-                    documents = []
-                    for row in result:
-                        doc = Document(
-                            id=row.id,
-                            title=row.title,
-                            abstract=row.abstract,
-                            document_date=row.document_date,
-                            document_type=row.document_type,
-                            major_document_type=row.major_document_type,
-                            volume_number=row.volume_number,
-                            total_volume_number=row.total_volume_number,
-                            url=row.url,
-                            language=row.language,
-                            country=row.country,
-                            author=row.author,
-                            publisher=row.publisher,
-                            created_at=row.created_at,
-                            updated_at=row.updated_at
+                    # Exact counts move far more slowly than the same search is repeated,
+                    # so they are cached on their own, keyed by the filter only
+                    total_count = self.count_cache.get(count_key)
+                    span.set_attribute("count_cache_hit", total_count is not None)
+                    if total_count is not None:
+                        rows = await self._run(settings, self._execute_page, statements.page, params)
+                    else:
+                        total_count, rows = await self._fetch_with_count(
+                            statements.count, statements.page, statements.combined, params, settings,
+                            statements.window
                         )
-                        documents.append(doc)
+                        self.count_cache.set(count_key, total_count)
+
+                next_cursor = None
+                if len(rows) > search_request.max_results:
+                    rows = rows[:search_request.max_results]
+                    next_cursor = self._encode_cursor(rows[-1], filter_key)
+                if fields is None:
+                    documents = [self._row_to_document(row) for row in rows]
+                else:
+                    span.set_attribute("fields", list(fields))
+                    documents = [self._row_to_partial_document(row, fields) for row in rows]
+                return SearchResult(total_count, documents, count_mode, next_cursor)
+
+        except SQLAlchemyError as e:
+            raise RuntimeError(f"Database error: {str(e)}")
+
+    def _use_memory_index(self, search_request: DocumentSearchRequest, span) -> bool:
+        """
+        Whether a search is answered by the memory index rather than Postgres
+
+        Raises:
+            ValueError: If the request asks for index mode and the index cannot serve it
+        """
+        if search_request.id or not search_request.search_text:
+            return False
+        if (search_request.search_mode or self.default_search_mode) != SearchMode.INDEX:
+            return False
+        if self.memory_index is None:
+            raise ValueError("search_mode index requires SEARCH_MEMORY_INDEX to be enabled")
+        if search_request.title or search_request.abstract:
+            raise ValueError("search_mode index does not support the title and abstract filters")
+        if not self.memory_index.ready:
+            # Still loading; _bind_filters runs index mode as fulltext in Postgres
+            span.set_attribute("memory_index.fallback", True)
+            return False
+        return True
+
+    async def _query_memory_index(self, search_request: DocumentSearchRequest, span) -> SearchResult:
+        """
+        Rank the matches in the memory index and hydrate the requested page from Postgres
+        """
+        terms = tokenize(search_request.search_text)
+        filters = self._index_filters(search_request)
+        span.set_attribute("search_mode", SearchMode.INDEX.value)
+        span.set_attribute("memory_index.documents", self.memory_index.document_count)
 
-                    return total_count, documents
+        start = time.perf_counter()
+        hits = self.memory_index.search(terms, filters)
+        span.set_attribute("memory_index.search_ms", (time.perf_counter() - start) * 1000)
+        span.set_attribute("memory_index.hits", len(hits))
+
+        filter_key = hashlib.sha1(repr((SearchMode.INDEX.value, tuple(terms), filters)).encode()).hexdigest()[:16]
+        offset = 0
+        if search_request.cursor:
+            sort_key, cursor_id = self._decode_cursor(search_request.cursor, filter_key, ranked=True)
+            # Hits are sorted by (sort_key, id), so resume after the cursor's position
+            offset = bisect.bisect_right(hits, (sort_key, cursor_id))
+            span.set_attribute("cursor", True)
+
+        page = hits[offset:offset + search_request.max_results]
+        next_cursor = None
+        if offset + search_request.max_results < len(hits):
+            next_cursor = self._encode_cursor(page[-1], filter_key)
+
+        fields = self.selected_fields(search_request)
+        if fields is not None:
+            span.set_attribute("fields", list(fields))
+        # Rows deleted since the index last refreshed are simply missing here
+        documents, _ = await self.get_documents([hit.id for hit in page], fields)
+        # The index counts every match, so the count is always exact
+        return SearchResult(len(hits), documents, CountMode.EXACT, next_cursor)
+
+    def _facets_from_memory_index(self, facets_request: DocumentFacetsRequest) -> bool:
+        """
+        Whether facet counts can be popcounted from the memory index: it is loaded and
+        the request has no id, title or abstract filter, and either no search_text or
+        search_mode index
+        """
+        if self.memory_index is None or not self.memory_index.ready:
+            return False
+        if facets_request.id or facets_request.title or facets_request.abstract:
+            return False
+        return (
+            not facets_request.search_text
+            or (facets_request.search_mode or self.default_search_mode) == SearchMode.INDEX
+        )
+
+    @staticmethod
+    def _index_filters(search_request: DocumentSearchRequest) -> IndexFilters:
+        return IndexFilters(
+            country=search_request.country,
+            language=search_request.language,
+            doc_type=search_request.doc_type,
+            major_document_type=search_request.major_document_type,
+            start_date=search_request.start_date,
+            end_date=search_request.end_date,
+        )
+
+    async def _query_facets(self, facets_request: DocumentFacetsRequest) -> dict[str, List[FacetCount]]:
+        """
+        Compute facet counts from the memory index's bitmaps when it can serve the
+        request, otherwise against the database
+        """
+        try:
+            with tracer.start_as_current_span("query_facets") as span:
+                # Keep the requested order and drop repeats
+                facets = tuple(dict.fromkeys(facets_request.facets))
+                span.set_attribute("facets", [facet.value for facet in facets])
+                result = {facet.value: [] for facet in facets}
+                if not facets:
+                    return result
+
+                if self._facets_from_memory_index(facets_request):
+                    span.set_attribute("facets.source", "memory_index")
+                    terms = tokenize(facets_request.search_text) if facets_request.search_text else None
+                    counts = self.memory_index.facet_counts(
+                        terms, self._index_filters(facets_request), [facet.value for facet in facets]
+                    )
+                    for facet, values in counts.items():
+                        result[facet] = [FacetCount(value=value, count=count) for value, count in values.items()]
+                else:
+                    search_mode, filter_mask, params, settings = self._bind_filters(facets_request, span)
+                    shape = QueryShape(bool(facets_request.id), search_mode, filter_mask, False)
+                    if shape == QueryShape(False, None, 0, False):
+                        # The unfiltered corpus is precomputed in the document_facets view
+                        span.set_attribute("facets.source", "document_facets")
+                        statement = CORPUS_FACETS
+                        params = {"facets": [facet.value for facet in facets]}
+                    else:
+                        span.set_attribute("facets.source", "documents")
+                        span.set_attribute("filter_mask", filter_mask)
+                        statement = _build_facet_statement(shape, facets, self.database.percent)
+
+                    rows = await self._run(settings, self._execute_facets, statement, params)
+                    for row in rows:
+                        result[row.facet].append(FacetCount(value=row.value, count=row.count))
+                for counts in result.values():
+                    counts.sort(key=lambda count: (-count.count, count.value))
+                    del counts[facets_request.facet_limit:]
+                return result
 
         except SQLAlchemyError as e:
-            raise RuntimeError(f"Database error: {str(e)}")
\ No newline at end of file
+            raise RuntimeError(f"Database error: {str(e)}")
+
+    def _bind_filters(self, search_request: DocumentSearchRequest, span) -> tuple[Optional[SearchMode], int, dict, dict]:
+        """
+        Turn the filters of a request into bind parameters
+
+        Returns:
+            A tuple of (search_mode, filter_mask, params, settings) where search_mode is
+            None without search_text, filter_mask has one bit per FILTERS entry present,
+            and settings are transaction-local Postgres settings to apply first
+        """
+        params = {}
+        settings = {}
+        search_mode = None
+        filter_mask = 0
+
+        # In case the id is provided, we don't need to search by other criteria.
+        if search_request.id:
+            params["id"] = search_request.id
+            span.set_attribute("id", search_request.id)
+        else:
+            if search_request.search_text:
+                search_mode = search_request.search_mode or self.default_search_mode
+                if search_mode == SearchMode.INDEX:
+                    # Queries that reach Postgres in index mode (facets, exports, or
+                    # searches while the index loads) use its closest equivalent
+                    search_mode = SearchMode.FULLTEXT
+                span.set_attribute("search_text", search_request.search_text)
+                span.set_attribute("search_mode", search_mode.value)
+                if search_mode == SearchMode.ILIKE:
+                    params["search_text"] = f"%{search_request.search_text}%"
+                else:
+                    params["search_text"] = search_request.search_text
+                if search_mode == SearchMode.FUZZY:
+                    threshold = search_request.similarity_threshold
+                    if threshold is None:
+                        threshold = self.similarity_threshold
+                    settings["pg_trgm.word_similarity_threshold"] = str(threshold)
+                    span.set_attribute("similarity_threshold", threshold)
+
+            for bit, (field, param, _) in enumerate(FILTERS):
+                value = getattr(search_request, field)
+                if value:
+                    filter_mask |= 1 << bit
+                    if isinstance(value, datetime):
+                        # asyncpg rejects aware datetimes for timestamp columns
+                        value = to_naive_utc(value)
+                    params[param] = f"%{value}%" if field in LIKE_FILTERS else value
+                    span.set_attribute(param, value)
+        return search_mode, filter_mask, params, settings
+
+    @staticmethod
+    def selected_fields(search_request: DocumentSearchRequest) -> Optional[tuple[str, ...]]:
+        """
+        Fields requested in ``fields`` plus id, in DOCUMENT_COLUMNS order, or None when
+        every field is returned
+        """
+        if not search_request.fields:
+            return None
+        requested = {field.value for field in search_request.fields} | {"id"}
+        if len(requested) == len(DOCUMENT_COLUMNS):
+            return None
+        return tuple(field for field in DOCUMENT_COLUMNS if field in requested)
+
+    async def _fetch_with_count(self, count_query: TextClause, page_query: TextClause, combined_query: TextClause,
+                                params: dict, settings: dict,
+                                window_query: Optional[TextClause] = None) -> tuple[int, List[Row]]:
+        """
+        Fetch a count and a page of rows using the configured count strategy.
+        count_query must return a single total_count column, and combined_query is the
+        two joined into one statement as built by _build_statements.
+        """
+        if self.count_strategy == "window" and window_query is not None:
+            return await self._run(settings, self._execute_combined, window_query, params)
+
+        if self.count_strategy in ("single", "window"):
+            return await self._run(settings, self._execute_combined, combined_query, params)
+
+        if self.count_strategy == "parallel":
+            # Count and page on two pooled connections at the same time
+            total_count, rows = await asyncio.gather(
+                self._run(settings, self._execute_count, count_query, params),
+                self._run(settings, self._execute_page, page_query, params)
+            )
+            return total_count, rows
+
+        return await self._run(settings, self._execute_search, page_query, count_query, params)
+
+    async def _run(self, settings: dict, fn: Callable[..., T], *args: Any) -> T:
+        """
+        Run ``fn`` on a pooled connection (a read replica if one is configured),
+        applying transaction-local settings first
+        """
+        if not settings:
+            return await self.database.run(fn, *args, read_only=True)
+        return await self.database.run(self._execute_with_settings, settings, fn, *args, read_only=True)
+
+    @classmethod
+    def _execute_with_settings(cls, conn: Connection, settings: dict, fn: Callable[..., T], *args: Any) -> T:
+        cls._apply_settings(conn, settings)
+        return fn(conn, *args)
+
+    @staticmethod
+    def _apply_settings(conn: Connection, settings: dict) -> None:
+        for name, value in settings.items():
+            conn.execute(SET_CONFIG, {"name": name, "value": value})
+
+    @staticmethod
+    def _execute_latest_update(conn: Connection):
+        return conn.execute(LATEST_UPDATE).scalar()
+
+    @staticmethod
+    def _execute_by_id(conn: Connection, statement: TextClause, ids: List[str]) -> List[Row]:
+        return conn.execute(statement, {"ids": ids}).all()
+
+    @staticmethod
+    def _execute_refresh_facets(conn: Connection) -> None:
+        conn.execute(REFRESH_FACETS)
+        conn.commit()
+
+    @staticmethod
+    def _execute_facets(conn: Connection, statement: TextClause, params: dict) -> List[Row]:
+        return conn.execute(statement, params).all()
+
+    def _execute_search(self, conn: Connection, query: TextClause, count_query: TextClause, params: dict) -> tuple[int, List[Row]]:
+        """
+        Run the count and page queries one after the other on an open connection
+        """
+        return self._execute_count(conn, count_query, params), self._execute_page(conn, query, params)
+
+    def _execute_estimated(self, conn: Connection, explain_query: TextClause, query: TextClause, params: dict) -> tuple[int, List[Row]]:
+        """
+        Use the planner's row estimate as the count, then fetch the page
+        """
+        plan = conn.execute(explain_query, params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimated = int(plan[0]["Plan"]["Plan Rows"])
+        rows = self._execute_page(conn, query, params)
+        # The estimate can undershoot a page that is already in hand
+        return max(estimated, len(rows)), rows
+
+    def _execute_count(self, conn: Connection, count_query: TextClause, params: dict) -> int:
+        return conn.execute(count_query, params).scalar()
+
+    def _execute_page(self, conn: Connection, query: TextClause, params: dict) -> List[Row]:
+        return conn.execute(query, params).all()
+
+    def _execute_combined(self, conn: Connection, query: TextClause, params: dict) -> tuple[int, List[Row]]:
+        """
+        Run a page query whose rows carry a total_count column and split out the total
+        """
+        rows = conn.execute(query, params).all()
+        total_count = rows[0].total_count if rows else 0
+        return total_count, [row for row in rows if row.id is not None]
+
+    @staticmethod
+    def _encode_cursor(row: Row, filter_key: str) -> str:
+        """
+        Encode the sort position of the last row on a page as an opaque cursor
+        """
+        payload = {"f": filter_key, "id": row.id}
+        if "sort_key" in row._fields:
+            payload["k"] = row.sort_key
+        encoded = base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode())
+        return encoded.decode().rstrip("=")
+
+    @staticmethod
+    def _decode_cursor(cursor: str, filter_key: str, ranked: bool) -> tuple[Optional[float], str]:
+        """
+        Decode a cursor into (sort_key, id). ``ranked`` searches need a numeric
+        sort_key; for the others it is None.
+
+        Raises:
+            ValueError: If the cursor is malformed or was issued for a different search
+        """
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            cursor_filter, cursor_id = payload["f"], payload["id"]
+            sort_key = payload.get("k") if ranked else None
+        except (ValueError, TypeError, KeyError, AttributeError, binascii.Error):
+            raise ValueError("Invalid cursor")
+        # Checked here so a forged payload fails as a bad request rather than in the query
+        if not isinstance(cursor_id, str):
+            raise ValueError("Invalid cursor")
+        if ranked and (not isinstance(sort_key, (int, float)) or isinstance(sort_key, bool)):
+            raise ValueError("Invalid cursor")
+        if cursor_filter != filter_key:
+            raise ValueError("Cursor does not belong to this search")
+        return sort_key, cursor_id
+
+    @staticmethod
+    def _row_to_partial_document(row, fields: tuple[str, ...]) -> Document:
+        """
+        Build a Document holding only the selected fields. It cannot be validated
+        without its required fields, so it is constructed; serialize it with
+        ``exclude_unset`` so the missing fields are left out.
+        """
+        values = {name: getattr(row, name) for name in fields}
+        if "document_date" in values:
+            values["document_date"] = _as_datetime(values["document_date"])
+        return Document.model_construct(set(fields), **values)
+
+    @staticmethod
+    def _row_to_document(row) -> Document:
+        """
+        Build a Document from a full row without validating it: the documents
+        table's column types and NOT NULL constraints are the contract. content
+        and model are not selected and keep their defaults.
+        """
+        values = {name: getattr(row, name) for name in DOCUMENT_COLUMNS}
+        values["document_date"] = _as_datetime(values["document_date"])
+        return Document.model_construct(**values)
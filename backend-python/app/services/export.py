@@ -0,0 +1,36 @@
+import csv
+import io
+from typing import AsyncIterator, List, Optional, Union
+from ..models import Document, DocumentField, ExportFormat
+from ..responses import dumps
+
+MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+}
+
+async def encode_export(batches: AsyncIterator[List[Document]], export_format: ExportFormat,
+                        fields: Optional[List[str]] = None) -> AsyncIterator[Union[str, bytes]]:
+    """
+    Encode batches of documents as NDJSON lines or CSV rows, one chunk per batch
+
+    Args:
+        batches: Batches of documents, as produced by DocumentSearchService.export_documents
+        export_format: Output format
+        fields: CSV columns in order (default: every document field)
+    """
+    if export_format == ExportFormat.CSV:
+        columns = fields or [field.value for field in DocumentField]
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        yield buffer.getvalue()
+        async for documents in batches:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(document.model_dump(mode="json", include=set(columns)) for document in documents)
+            yield buffer.getvalue()
+        return
+
+    async for documents in batches:
+        yield b"".join(dumps(document.model_dump(exclude_unset=True)) + b"\n" for document in documents)
@@ -1,11 +1,15 @@
 import os
 from typing import Dict, Optional, Type, Union
+import anthropic
+import httpx
+import openai
 from pydantic import BaseModel, Field
 from langchain.chat_models.base import BaseChatModel
 from langchain_openai import ChatOpenAI
 from langchain_anthropic import ChatAnthropic
 
 from ..models import LLMModel
+from .token_budget import TokenBudget, TokenCounter
 
 class ModelSettings(BaseModel):
     """Base model for LLM settings"""
@@ -30,6 +34,12 @@ class ModelConfig(BaseModel):
     model_class: Type[BaseChatModel]
     requires_key: str
     settings: Union[OpenAISettings, AnthropicSettings]
+    # Tokens of prompt plus output the model accepts
+    context_window: int
+    # Tokens kept free for the output (ChatAnthropic's default max_tokens)
+    output_tokens: int = 1024
+    # Tokenizer counts are multiplied by this, for models counted with another model's tokenizer
+    token_scale: float = 1.0
     
     model_config = {
         'protected_namespaces': ()
@@ -37,14 +47,33 @@ class ModelConfig(BaseModel):
 
 class LLMConfig:
     """
-    Configuration manager for different LLM models
+    Configuration manager for different LLM models.
+
+    Each model's client is created on first use and reused afterwards, and all
+    models of a provider share one keep-alive HTTP connection pool, so requests
+    after the first skip client construction and the TCP/TLS handshake.
+    Call aclose() on shutdown to close the pools.
     """
     def __init__(self):
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         self.anthropic_api_key = os.getenv("ANTHROPIC_API_KEY")
+        self.openai_base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
         
         if not self.openai_api_key and not self.anthropic_api_key:
             raise ValueError("Either OPENAI_API_KEY or ANTHROPIC_API_KEY must be provided")
+
+        # Limits of each provider's connection pool
+        self.http_limits = httpx.Limits(
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", 100)),
+            max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 20)),
+            keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", 30))
+        )
+        # The provider SDKs' own default: 10 minutes, 5 seconds to connect
+        self.http_timeout = httpx.Timeout(float(os.getenv("LLM_REQUEST_TIMEOUT", 600)), connect=5.0)
+        self._llms: Dict[LLMModel, BaseChatModel] = {}
+        self._budgets: Dict[LLMModel, TokenBudget] = {}
+        # requires_key -> connection pool shared by that provider's models
+        self._http_clients: Dict[str, httpx.AsyncClient] = {}
         
         # Model configurations with their respective settings
         self.model_configs: Dict[LLMModel, ModelConfig] = {
@@ -55,8 +84,9 @@ class LLMConfig:
                     temperature=0,
                     model_name="gpt-3.5-turbo-16k",
                     openai_api_key=self.openai_api_key,
-                    base_url="https://api.openai.com/v1"
-                )
+                    base_url=self.openai_base_url
+                ),
+                context_window=16385
             ),
             LLMModel.GPT4_TURBO: ModelConfig(
                 model_class=ChatOpenAI,
@@ -65,8 +95,9 @@ class LLMConfig:
                     temperature=0,
                     model_name="gpt-4-turbo-preview",
                     openai_api_key=self.openai_api_key,
-                    base_url="https://api.openai.com/v1"
-                )
+                    base_url=self.openai_base_url
+                ),
+                context_window=128000
             ),
             LLMModel.CLAUDE_3_SONNET: ModelConfig(
                 model_class=ChatAnthropic,
@@ -76,7 +107,10 @@ class LLMConfig:
                     model_name="claude-3-7-sonnet-20250219",
                     anthropic_api_key=self.anthropic_api_key,
                     base_url="https://api.anthropic.com/v1"
-                )
+                ),
+                context_window=200000,
+                # Claude's tokenizer is not public; cl100k_base undercounts its tokens
+                token_scale=1.2
             ),
             LLMModel.CLAUDE_3_OPUS: ModelConfig(
                 model_class=ChatAnthropic,
@@ -86,13 +120,16 @@ class LLMConfig:
                     model_name="claude-3-opus-20240229",
                     anthropic_api_key=self.anthropic_api_key,
                     base_url="https://api.anthropic.com/v1"
-                )
+                ),
+                context_window=200000,
+                # Claude's tokenizer is not public; cl100k_base undercounts its tokens
+                token_scale=1.2
             )
         }
     
     def get_llm(self, model: LLMModel) -> BaseChatModel:
         """
-        Get an instance of the specified LLM model
+        Get the shared instance of the specified LLM model, creating it on first use
         
         Args:
             model: The LLM model to instantiate
@@ -103,6 +140,52 @@ class LLMConfig:
         Raises:
             ValueError: If the required API key is not available
         """
+        config = self._model_config(model)
+        llm = self._llms.get(model)
+        if llm is None:
+            llm = self._llms[model] = self._create_llm(config)
+        return llm
+
+    def get_budget(self, model: LLMModel) -> TokenBudget:
+        """
+        Get the token budget of the specified LLM model
+
+        Raises:
+            ValueError: If the model is unsupported or its API key is not available
+        """
+        config = self._model_config(model)
+        budget = self._budgets.get(model)
+        if budget is None:
+            # Models tiktoken does not know are counted with cl100k_base
+            tokenizer_model = config.settings.model_name if config.model_class is ChatOpenAI else None
+            budget = self._budgets[model] = TokenBudget(
+                TokenCounter(tokenizer_model, config.token_scale),
+                config.context_window,
+                config.output_tokens
+            )
+        return budget
+
+    def load_tokenizers(self) -> None:
+        """
+        Load the tokenizer of every model with an API key. Blocks, and may download
+        the encodings, so run it in a worker thread at startup.
+        """
+        for model in self.model_configs:
+            try:
+                self.get_budget(model).counter.load()
+            except ValueError:
+                continue
+
+    def provider(self, model: LLMModel) -> str:
+        """
+        Name of the provider serving the model, shared by all of its models
+
+        Raises:
+            ValueError: If the model is unsupported or its API key is not available
+        """
+        return self._model_config(model).requires_key
+
+    def _model_config(self, model: LLMModel) -> ModelConfig:
         config = self.model_configs.get(model)
         if not config:
             raise ValueError(f"Unsupported model: {model}")
@@ -113,6 +196,46 @@ class LLMConfig:
             raise ValueError(f"OpenAI API key required for model {model}")
         elif required_key == "ANTHROPIC_API_KEY" and not self.anthropic_api_key:
             raise ValueError(f"Anthropic API key required for model {model}")
-        
-        # Create and return the LLM instance
-        return config.model_class(**config.settings.model_dump())
+        return config
+
+    def _create_llm(self, config: ModelConfig) -> BaseChatModel:
+        settings = config.settings.model_dump()
+        http_client = self._http_client(config.requires_key)
+        if config.model_class is ChatOpenAI:
+            async_client = openai.AsyncOpenAI(
+                api_key=self.openai_api_key,
+                base_url=settings["base_url"],
+                timeout=self.http_timeout,
+                http_client=http_client
+            )
+            return ChatOpenAI(**settings, async_client=async_client.chat.completions)
+
+        llm = config.model_class(**settings)
+        # langchain-anthropic always builds its own clients and takes no HTTP client,
+        # so replace the async one with a client on the shared pool
+        object.__setattr__(llm, "_async_client", anthropic.AsyncClient(
+            api_key=self.anthropic_api_key,
+            timeout=self.http_timeout,
+            http_client=http_client
+        ))
+        return llm
+
+    def _http_client(self, provider: str) -> httpx.AsyncClient:
+        client = self._http_clients.get(provider)
+        if client is None:
+            client = self._http_clients[provider] = httpx.AsyncClient(
+                limits=self.http_limits,
+                timeout=self.http_timeout,
+                # As the provider SDKs' own clients do
+                follow_redirects=True
+            )
+        return client
+
+    async def aclose(self) -> None:
+        """
+        Close the connection pools and drop the cached clients
+        """
+        self._llms.clear()
+        clients, self._http_clients = self._http_clients, {}
+        for client in clients.values():
+            await client.aclose()
@@ -0,0 +1,369 @@
+import asyncio
+import logging
+import math
+import re
+import sys
+import time
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Sequence
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Row
+from opentelemetry import trace
+from .bitmap_index import BitmapIndex
+from .database import Database
+from .dates import to_naive_utc
+
+tracer = trace.get_tracer(__name__)
+logger = logging.getLogger(__name__)
+
+INDEX_COLUMNS = "id, title, abstract, country, lang, docty, majdocty, created_at, updated_at"
+ALL_DOCUMENTS = text(f"SELECT {INDEX_COLUMNS} FROM documents")
+CHANGED_DOCUMENTS = text(f"SELECT {INDEX_COLUMNS} FROM documents WHERE updated_at >= :since")
+ALL_IDS = text("SELECT id FROM documents")
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Title terms count this many times towards term frequency and document length
+TITLE_WEIGHT = 2
+
+# Deltas re-read rows this far behind the newest updated_at seen, so rows from
+# transactions that committed late are not missed; unchanged rows are skipped
+DELTA_OVERLAP = timedelta(seconds=5)
+
+# Categorical columns with one bitmap per value, named like the FacetField values
+BITMAP_COLUMNS = ("country", "language", "document_type", "major_document_type")
+
+NO_MATCHES = (np.zeros(0, dtype=np.int64), np.zeros(0))
+
+def tokenize(value: Optional[str]) -> List[str]:
+    """
+    Case-folded word tokens of a text
+    """
+    return TOKEN_PATTERN.findall(value.casefold()) if value else []
+
+class IndexFilters(NamedTuple):
+    """Equality and date filters of a search, as evaluated by the index"""
+    country: Optional[str] = None
+    language: Optional[str] = None
+    doc_type: Optional[str] = None
+    major_document_type: Optional[str] = None
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+
+class IndexHit(NamedTuple):
+    """A match, ordered like ranked search results: sort_key (negated score), then id"""
+    sort_key: float
+    id: str
+
+class _IndexState:
+    """
+    The index data. Documents live in slots numbered in the order they were added;
+    a changed document gets a new slot and its old slot becomes a tombstone, so
+    postings stay sorted by slot without ever being rewritten.
+    """
+    def __init__(self):
+        self.ids: List[str] = []
+        self.slots: Dict[str, int] = {}
+        self.lengths = array("I")
+        self.updated_at: List[datetime] = []
+        # Live slots, filter columns and created_at
+        self.bitmaps = BitmapIndex(BITMAP_COLUMNS)
+        # term -> term id; postings and document frequencies are indexed by term id
+        self.term_ids: Dict[str, int] = {}
+        # (slots, term frequencies), sorted by slot
+        self.postings: List[tuple[array, array]] = []
+        # Live documents containing each term, for idf
+        self.document_frequency = array("I")
+        # Term ids of the document in each slot, kept so removing it can update
+        # document_frequency: slot_terms[term_offsets[slot]:term_offsets[slot + 1]]
+        self.slot_terms = array("I")
+        self.term_offsets = array("Q", [0])
+        self.alive_count = 0
+        self.dead_count = 0
+        self.total_length = 0
+        self.last_seen: Optional[datetime] = None
+
+    def add(self, row: Row) -> None:
+        old = self.slots.get(row.id)
+        if old is not None:
+            self.remove(old)
+
+        counts = Counter(tokenize(row.abstract))
+        for _ in range(TITLE_WEIGHT):
+            counts.update(tokenize(row.title))
+        length = sum(counts.values())
+
+        slot = self.bitmaps.append({
+            "country": row.country,
+            "language": row.lang,
+            "document_type": row.docty,
+            "major_document_type": row.majdocty,
+        }, row.created_at)
+        self.ids.append(row.id)
+        self.slots[row.id] = slot
+        self.lengths.append(length)
+        self.updated_at.append(row.updated_at)
+        for term, frequency in counts.items():
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                term_id = self.term_ids[term] = len(self.postings)
+                self.postings.append((array("I"), array("H")))
+                self.document_frequency.append(0)
+            slots, frequencies = self.postings[term_id]
+            slots.append(slot)
+            frequencies.append(min(frequency, 0xFFFF))
+            self.document_frequency[term_id] += 1
+            self.slot_terms.append(term_id)
+        self.term_offsets.append(len(self.slot_terms))
+
+        self.alive_count += 1
+        self.total_length += length
+        if self.last_seen is None or (row.updated_at is not None and row.updated_at > self.last_seen):
+            self.last_seen = row.updated_at
+
+    def add_all(self, rows: Sequence[Row]) -> None:
+        for row in rows:
+            self.add(row)
+
+    def remove(self, slot: int) -> None:
+        self.bitmaps.remove(slot)
+        del self.slots[self.ids[slot]]
+        for term_id in self.slot_terms[self.term_offsets[slot]:self.term_offsets[slot + 1]]:
+            self.document_frequency[term_id] -= 1
+        self.alive_count -= 1
+        self.dead_count += 1
+        self.total_length -= self.lengths[slot]
+
+    def memory_bytes(self) -> int:
+        """
+        Approximate memory held by the index, including strings and containers
+        """
+        total = sum(sys.getsizeof(part) for part in (
+            self.ids, self.slots, self.lengths, self.updated_at, self.term_ids, self.postings,
+            self.document_frequency, self.slot_terms, self.term_offsets
+        ))
+        total += self.bitmaps.memory_bytes()
+        total += sum(sys.getsizeof(doc_id) for doc_id in self.ids)
+        total += sum(sys.getsizeof(value) for value in self.updated_at if value is not None)
+        total += sum(sys.getsizeof(term) for term in self.term_ids)
+        for slots, frequencies in self.postings:
+            total += sys.getsizeof(slots) + sys.getsizeof(frequencies) + 56
+        return total
+
+class MemoryIndex:
+    """
+    In-memory inverted index over documents.title and documents.abstract with BM25 ranking.
+    The equality and date filters, and facet counts, are evaluated on a BitmapIndex
+    over the same slots.
+
+    The whole table (without content) is loaded once, then rows whose updated_at moved
+    are re-indexed every ``refresh_interval`` seconds, and documents whose rows were
+    deleted are dropped every ``purge_interval`` seconds. The index is rebuilt once
+    tombstones reach ``rebuild_ratio`` of the live documents.
+    """
+    def __init__(self, database: Database, refresh_interval: float, purge_interval: float = 60,
+                 rebuild_ratio: float = 0.25, k1: float = 1.2, b: float = 0.75):
+        self.database = database
+        self.refresh_interval = refresh_interval
+        self.purge_interval = purge_interval
+        self.rebuild_ratio = rebuild_ratio
+        self.k1 = k1
+        self.b = b
+        self._state: Optional[_IndexState] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._state is not None
+
+    @property
+    def document_count(self) -> int:
+        return self._state.alive_count if self._state else 0
+
+    async def run(self) -> None:
+        """
+        Build the index, then keep it current until cancelled
+        """
+        while self._state is None:
+            try:
+                await self.load()
+            except Exception as e:
+                logger.warning(f"could not build the memory index: {e}")
+                await asyncio.sleep(max(self.refresh_interval, 1))
+        last_purge = time.monotonic()
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                state = self._state
+                if state.dead_count > state.alive_count * self.rebuild_ratio:
+                    await self.load()
+                    last_purge = time.monotonic()
+                else:
+                    await self.refresh()
+                    if time.monotonic() - last_purge >= self.purge_interval:
+                        last_purge = time.monotonic()
+                        await self.purge()
+            except Exception as e:
+                logger.warning(f"could not refresh the memory index: {e}")
+
+    async def load(self) -> None:
+        """
+        Build a new index from the documents table and swap it in once complete.
+        Tokenizing a batch takes long enough to stall every request, so batches
+        are indexed in a worker thread; the new state is not shared until then.
+        """
+        with tracer.start_as_current_span("memory_index.load") as span:
+            start = time.perf_counter()
+            state = _IndexState()
+            async for rows in self.database.stream(ALL_DOCUMENTS, {}, 5000, read_only=True):
+                await asyncio.to_thread(state.add_all, rows)
+            build_ms = (time.perf_counter() - start) * 1000
+            memory_bytes = state.memory_bytes()
+            self._state = state
+            span.set_attribute("memory_index.documents", state.alive_count)
+            span.set_attribute("memory_index.terms", len(state.postings))
+            span.set_attribute("memory_index.bytes", memory_bytes)
+            span.set_attribute("memory_index.build_ms", build_ms)
+            logger.info(
+                f"built memory index: {state.alive_count} documents, {len(state.postings)} terms, "
+                f"{memory_bytes / (1024 * 1024):.1f} MB in {build_ms:.0f} ms"
+            )
+
+    async def refresh(self) -> int:
+        """
+        Re-index rows whose updated_at moved since the last load or refresh
+        Returns the number of documents re-indexed
+        """
+        state = self._state
+        if state is None or state.last_seen is None:
+            return 0
+        rows = await self.database.run(
+            self._execute_changed, state.last_seen - DELTA_OVERLAP, read_only=True
+        )
+        changed = 0
+        for row in rows:
+            slot = state.slots.get(row.id)
+            if slot is not None and state.updated_at[slot] == row.updated_at:
+                continue
+            state.add(row)
+            changed += 1
+        if changed:
+            logger.info(f"re-indexed {changed} changed documents in the memory index")
+        return changed
+
+    async def purge(self) -> int:
+        """
+        Drop documents whose rows were deleted from the documents table
+        Returns the number of documents dropped
+        """
+        state = self._state
+        if state is None:
+            return 0
+        # Taken before the query, so documents indexed meanwhile are not dropped
+        deleted = set(state.slots)
+        async for rows in self.database.stream(ALL_IDS, {}, 50000, read_only=True):
+            deleted.difference_update(row.id for row in rows)
+        removed = 0
+        for doc_id in deleted:
+            slot = state.slots.get(doc_id)
+            if slot is not None:
+                state.remove(slot)
+                removed += 1
+        if removed:
+            logger.info(f"dropped {removed} deleted documents from the memory index")
+        return removed
+
+    @staticmethod
+    def _execute_changed(conn: Connection, since: datetime) -> List[Row]:
+        return conn.execute(CHANGED_DOCUMENTS, {"since": since}).all()
+
+    def search(self, terms: List[str], filters: IndexFilters) -> List[IndexHit]:
+        """
+        Every live document containing all ``terms`` and passing ``filters``,
+        best BM25 score first (ties by id)
+        """
+        state = self._loaded_state()
+        slots, scores = self._score(state, terms)
+        if not len(slots):
+            return []
+        matches = state.bitmaps.contains(self._filter_mask(state, filters), slots)
+        hits = [
+            IndexHit(-score, state.ids[slot])
+            for slot, score in zip(slots[matches].tolist(), scores[matches].tolist())
+        ]
+        hits.sort()
+        return hits
+
+    def facet_counts(self, terms: Optional[List[str]], filters: IndexFilters,
+                     columns: Sequence[str]) -> Dict[str, Dict[str, int]]:
+        """
+        Count the live documents passing ``filters`` (and containing all ``terms``,
+        unless None) by each value of each of ``columns``
+        """
+        state = self._loaded_state()
+        mask = self._filter_mask(state, filters)
+        if terms is not None:
+            np.bitwise_and(mask, state.bitmaps.from_slots(self._score(state, terms)[0]), out=mask)
+        return {column: state.bitmaps.counts(column, mask) for column in columns}
+
+    def _loaded_state(self) -> _IndexState:
+        if self._state is None:
+            raise RuntimeError("The memory index is not loaded")
+        return self._state
+
+    def _score(self, state: _IndexState, terms: List[str]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Every slot containing all ``terms``, tombstones included, in slot order,
+        and its BM25 score
+        """
+        term_ids = []
+        for term in dict.fromkeys(terms):
+            term_id = state.term_ids.get(term)
+            if term_id is None:
+                return NO_MATCHES
+            term_ids.append(term_id)
+        if not term_ids:
+            return NO_MATCHES
+        # Intersect starting from the rarest term
+        term_ids.sort(key=lambda term_id: len(state.postings[term_id][0]))
+
+        documents = max(state.alive_count, 1)
+        average_length = state.total_length / documents if state.total_length else 1.0
+        k1, b = self.k1, self.b
+        # Views of the arrays, released before anything can append to them again
+        lengths = np.frombuffer(state.lengths, dtype=state.lengths.typecode)
+
+        candidates = scores = None
+        for term_id in term_ids:
+            slots, frequencies = state.postings[term_id]
+            slots = np.frombuffer(slots, dtype=slots.typecode)
+            frequencies = np.frombuffer(frequencies, dtype=frequencies.typecode)
+            if candidates is None:
+                candidates, scores = slots, np.zeros(len(slots))
+            else:
+                # Postings are sorted by slot, so look each candidate up by binary search
+                positions = np.minimum(np.searchsorted(slots, candidates), len(slots) - 1)
+                found = slots[positions] == candidates
+                candidates, scores, frequencies = candidates[found], scores[found], frequencies[positions[found]]
+            frequency = state.document_frequency[term_id]
+            idf = math.log(1 + (documents - frequency + 0.5) / (frequency + 0.5))
+            norm = k1 * (1 - b + b * lengths[candidates] / average_length)
+            scores = scores + idf * frequencies * (k1 + 1) / (frequencies + norm)
+            if not len(candidates):
+                break
+        return candidates.astype(np.int64), scores
+
+    @staticmethod
+    def _filter_mask(state: _IndexState, filters: IndexFilters) -> np.ndarray:
+        return state.bitmaps.select(
+            {
+                "country": filters.country,
+                "language": filters.language,
+                "document_type": filters.doc_type,
+                "major_document_type": filters.major_document_type,
+            },
+            to_naive_utc(filters.start_date),
+            to_naive_utc(filters.end_date),
+        )
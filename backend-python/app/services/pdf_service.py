@@ -1,7 +1,9 @@
+import asyncio
 import os
 from re import I
 import tempfile
-from typing import Optional
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
 import aiohttp
 from PyPDF2 import PdfReader
 from opentelemetry import trace
@@ -13,7 +15,8 @@ logger.setLevel(logging.DEBUG)
 
 class PDFService:
     def __init__(self):
-        self.max_tokens = int(os.getenv("MAX_TOKENS", 1000))
+        # Coarse cap on extracted words; the summarizer trims the text to the model's budget
+        self.max_tokens = int(os.getenv("MAX_TOKENS", 32000))
         self.temp_dir = tempfile.gettempdir()
 
     async def download_and_extract_text(self, doc_id: str, url: str) -> Optional[str]:
@@ -34,57 +37,89 @@ class PDFService:
         with tracer.start_as_current_span("download_and_extract_text") as span:
             span.set_attribute("doc_id", doc_id)
             span.set_attribute("url", url)
-            logger.info(f"[{doc_id}] received request to extract text from {url}")
-            
-            # Validate URL
-            if not url.lower().endswith('.pdf'):
-                raise ValueError("URL does not point to a PDF file")
-            
-            # Create temp file path
-            pdf_path = os.path.join(self.temp_dir, f"{doc_id}.pdf")
-            
-            try:
-                # Download file
-                async with aiohttp.ClientSession() as session:
-                    with tracer.start_span("download_pdf") as download_span:
-                        async with session.get(url) as response:
-                            if response.status != 200:
-                                raise IOError(f"Failed to download PDF: HTTP {response.status}")
-                            
-                            # Check content type
-                            content_type = response.headers.get('content-type', '')
-                            if 'application/pdf' not in content_type.lower():
-                                raise ValueError(f"Invalid content type: {content_type}")
-                            
-                            # Save to temp file
-                            with open(pdf_path, 'wb') as f:
-                                logger.debug("save file started")
-                                while True:
-                                    chunk = await response.content.read(8192)
-                                    if not chunk:
-                                        break
-                                    f.write(chunk)
+            async with self.download(doc_id, url) as pdf_path:
+                return await self.extract_text(pdf_path)
+
+    @asynccontextmanager
+    async def download(self, doc_id: str, url: str) -> AsyncIterator[str]:
+        """
+        Downloads a PDF file to a temporary file, which is removed on exit.
+
+        Args:
+            doc_id: Document ID to use as filename
+            url: URL to download the PDF from
+
+        Yields:
+            str: Path of the downloaded file
+
+        Raises:
+            ValueError: If URL is invalid or file is not a PDF
+            IOError: If download or file operations fail
+        """
+        logger.info(f"[{doc_id}] received request to extract text from {url}")
+        
+        # Validate URL
+        if not url.lower().endswith('.pdf'):
+            raise ValueError("URL does not point to a PDF file")
+        
+        # Unique temp file, so concurrent requests for the same document do not collide
+        fd, pdf_path = tempfile.mkstemp(prefix=f"{doc_id}-", suffix=".pdf", dir=self.temp_dir)
+        os.close(fd)
+        
+        try:
+            # Download file
+            async with aiohttp.ClientSession() as session:
+                with tracer.start_span("download_pdf") as download_span:
+                    async with session.get(url) as response:
+                        if response.status != 200:
+                            raise IOError(f"Failed to download PDF: HTTP {response.status}")
+                        
+                        # Check content type
+                        content_type = response.headers.get('content-type', '')
+                        if 'application/pdf' not in content_type.lower():
+                            raise ValueError(f"Invalid content type: {content_type}")
+                        
+                        # Save to temp file
+                        with open(pdf_path, 'wb') as f:
+                            logger.debug("save file started")
+                            while True:
+                                chunk = await response.content.read(8192)
+                                if not chunk:
+                                    break
+                                f.write(chunk)
+            yield pdf_path
                 
-                # Extract text
-                with tracer.start_span("extract_text") as extract_span:
-                    try:
-                        reader = PdfReader(pdf_path)
-                        text = ""
-                        tokens = 0
-                        logger.debug("extracting file..")
-                        for page in reader.pages:
-                            text += page.extract_text() + "\n"
-                            # count the words in the text
-                            words = text.split()
-                            tokens += len(words)
-                            if tokens > self.max_tokens:
-                                break
-                        logger.debug(f"extracted {str(tokens)} tokens from {str(text)} characters")
-                        return text.strip()
-                    except Exception as e:
-                        raise IOError(f"Failed to extract text from PDF: {str(e)}")
-                    
-            finally:
-                # Clean up temp file
-                if os.path.exists(pdf_path):
-                    os.remove(pdf_path)
+        finally:
+            # Clean up temp file
+            if os.path.exists(pdf_path):
+                os.remove(pdf_path)
+
+    async def extract_text(self, pdf_path: str) -> str:
+        """
+        Extracts the text content of a downloaded PDF file.
+
+        Raises:
+            IOError: If the file cannot be parsed
+        """
+        # Extract text in a worker thread; parsing is CPU-bound and would stall
+        # every other request, including other documents of the same summary
+        with tracer.start_span("extract_text") as extract_span:
+            try:
+                return await asyncio.to_thread(self._extract_text, pdf_path)
+            except Exception as e:
+                raise IOError(f"Failed to extract text from PDF: {str(e)}")
+
+    def _extract_text(self, pdf_path: str) -> str:
+        reader = PdfReader(pdf_path)
+        text = ""
+        tokens = 0
+        logger.debug("extracting file..")
+        for page in reader.pages:
+            page_text = page.extract_text()
+            text += page_text + "\n"
+            # count the words of this page only; text holds every page so far
+            tokens += len(page_text.split())
+            if tokens > self.max_tokens:
+                break
+        logger.debug(f"extracted {str(tokens)} words in {str(len(text))} characters")
+        return text.strip()
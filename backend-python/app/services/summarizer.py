@@ -1,14 +1,64 @@
-from typing import Optional
+import asyncio
+import hashlib
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional
 from langchain.docstore.document import Document as LangChainDocument
+from langchain.chains.combine_documents.base import BaseCombineDocumentsChain
 from langchain.chains.summarize import load_summarize_chain
 from langchain.prompts import PromptTemplate
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from opentelemetry import trace
 
-from ..models import Document
+from ..models import Document, LLMModel
+from .database import Database
 from .llm_config import LLMConfig
+from .summary_cache import CachedSummary, SummaryCache, SummaryKey
+from .token_budget import TokenBudget, TokenCounter
+
+tracer = trace.get_tracer(__name__)
+
+# Summarization strategies: one prompt with the whole text, or summaries of
+# chunks (map) combined into one (reduce)
+STUFF = "stuff"
+MAP_REDUCE = "map_reduce"
+
+def _hash(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()[:16]
+
+class _TokenUsage:
+    """
+    Tokens sent to and received from the LLM while generating one summary
+    """
+    def __init__(self, counter: TokenCounter):
+        self.counter = counter
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def add(self, prompt: str, output: str) -> None:
+        self.calls += 1
+        self.input_tokens += self.counter.count(prompt)
+        self.output_tokens += self.counter.count(output)
 
 class DocumentSummarizer:
-    def __init__(self):
+    def __init__(self, database: Optional[Database] = None):
         self.llm_config = LLMConfig()
+        self.summary_cache = SummaryCache(database)
+        # Summarize chain per model, built on first use; chains hold no per-call state
+        self._chains: Dict[LLMModel, BaseCombineDocumentsChain] = {}
+
+        # Longer texts are cut to max_input_tokens before summarizing
+        self.max_input_tokens = int(os.getenv("SUMMARY_MAX_INPUT_TOKENS", 32000))
+        # Texts that do not fit in one prompt of the model, or are longer than
+        # stuff_max_tokens if set, are summarized in chunks of up to chunk_tokens
+        self.chunk_tokens = int(os.getenv("SUMMARY_CHUNK_TOKENS", 3000))
+        self.chunk_overlap = int(os.getenv("SUMMARY_CHUNK_OVERLAP", 200))
+        stuff_max_tokens = os.getenv("SUMMARY_STUFF_MAX_TOKENS")
+        self.stuff_max_tokens = int(stuff_max_tokens) if stuff_max_tokens else None
+        # Chunk summaries in flight at once per provider, across all documents
+        self.map_concurrency = int(os.getenv("SUMMARY_MAP_CONCURRENCY", 4))
+        self._map_slots: Dict[str, asyncio.Semaphore] = {}
         
         # Use regular PromptTemplate with text variable
         self.prompt_template = PromptTemplate(
@@ -23,16 +73,54 @@ class DocumentSummarizer:
 
             Summary:"""
         )
+        self.map_prompt = PromptTemplate(
+            input_variables=["text"],
+            template="""You are a helpful assistant that summarizes one part of a longer document.
+            Keep the main points, key findings, figures and conclusions of this part, and leave out anything else.
     
-    async def summarize(self, document: Document) -> str:
+            Please summarize the following part of the document:
+
+            {text}
+
+            Summary of this part:"""
+        )
+        self.combine_prompt = PromptTemplate(
+            input_variables=["text"],
+            template="""You are a helpful assistant that creates comprehensive yet concise summaries of documents.
+            The following are summaries of consecutive parts of one document.
+            Combine them into a single summary of the whole document, focusing on the main points,
+            key findings, and important conclusions.
+            If the document appears to be a report or research paper, include methodology and results.
+
+            {text}
+
+            Summary:"""
+        )
+
+        # Hash of the prompts (and chunking) of each strategy, so cached summaries
+        # are dropped when they change
+        self.prompt_versions = {
+            STUFF: _hash(self.prompt_template.template),
+            MAP_REDUCE: _hash(
+                MAP_REDUCE, self.map_prompt.template, self.combine_prompt.template,
+                str(self.chunk_tokens), str(self.chunk_overlap)
+            ),
+        }
+        # For summaries keyed by their PDF's source, whose text (and so strategy)
+        # is not known until it has been downloaded
+        self.source_prompt_version = _hash(*self.prompt_versions.values(), str(self.max_input_tokens))
+
+    async def summarize(self, document: Document) -> CachedSummary:
         """
-        Generate a summary for the given document using LangChain and OpenAI.
+        Generate a summary for the given document using LangChain and OpenAI,
+        or return the cached one for the same text, model and prompt.
+        Long texts are summarized with map-reduce (see _strategy).
         
         Args:
             document: The document to summarize
             
         Returns:
-            str: The generated summary
+            CachedSummary: The summary text and where it came from (memory, database or generated)
             
         Raises:
             ValueError: If no content is provided for summarization
@@ -42,7 +130,196 @@ class DocumentSummarizer:
         
         if not text_to_summarize:
             raise ValueError("No content provided for summarization")
-        
+
+        with tracer.start_as_current_span("summarize") as span:
+            budget = self.llm_config.get_budget(document.model)
+            text = budget.counter.trim(text_to_summarize, self.max_input_tokens)
+            strategy = self._strategy(budget, text.tokens)
+            key = self._summary_key(document, text.text, strategy)
+            span.set_attribute("doc_id", document.id)
+            span.set_attribute("model", key.model)
+            span.set_attribute("summary.strategy", strategy)
+            self._set_text_attributes(span, budget, text)
+            usage = _TokenUsage(budget.counter)
+            summary = await self.summary_cache.get_or_generate(
+                key, lambda: self._generate(document, text.text, strategy, budget, usage),
+                alias=self._source_key(document)
+            )
+            span.set_attribute("summary.cache", summary.source)
+            self._set_usage_attributes(span, usage)
+            return summary
+
+    async def lookup(self, document: Document) -> Optional[CachedSummary]:
+        """
+        Return the cached summary of the document's PDF, found by its url and
+        updated_at rather than its text so the PDF need not be downloaded, or None.
+        Summaries are stored under this key by summarize and stream.
+        """
+        key = self._source_key(document)
+        if key is None:
+            return None
+        with tracer.start_as_current_span("summarize.lookup") as span:
+            span.set_attribute("doc_id", document.id)
+            span.set_attribute("model", key.model)
+            summary = await self.summary_cache.lookup(key)
+            span.set_attribute("summary.cache", summary.source if summary else "miss")
+            return summary
+
+    async def stream(self, document: Document) -> AsyncIterator[CachedSummary]:
+        """
+        Like summarize, but yield the summary in pieces as the LLM produces them.
+        A cached summary is yielded whole. With map-reduce, the chunks are summarized
+        first and the final combining call is streamed. A streamed summary is cached
+        once it is complete; one abandoned midway is not.
+
+        Args:
+            document: The document to summarize
+
+        Yields:
+            CachedSummary: The next piece of the summary text and where it came from
+
+        Raises:
+            ValueError: If no content is provided for summarization
+        """
+        text_to_summarize = self._prepare_text(document)
+
+        if not text_to_summarize:
+            raise ValueError("No content provided for summarization")
+
+        with tracer.start_as_current_span("summarize") as span:
+            budget = self.llm_config.get_budget(document.model)
+            text = budget.counter.trim(text_to_summarize, self.max_input_tokens)
+            strategy = self._strategy(budget, text.tokens)
+            key = self._summary_key(document, text.text, strategy)
+            span.set_attribute("doc_id", document.id)
+            span.set_attribute("model", key.model)
+            span.set_attribute("summary.strategy", strategy)
+            span.set_attribute("summary.streamed", True)
+            self._set_text_attributes(span, budget, text)
+            cached = await self.summary_cache.lookup(key)
+            if cached is not None:
+                span.set_attribute("summary.cache", cached.source)
+                # A memory hit was stored by source when it was loaded
+                if cached.source == "database":
+                    await self._store_by_source(document, cached.summary_text)
+                yield cached
+                return
+
+            span.set_attribute("summary.cache", "generated")
+            start = time.perf_counter()
+            llm = self.llm_config.get_llm(document.model)
+            usage = _TokenUsage(budget.counter)
+            if strategy == MAP_REDUCE:
+                prompt = await self._map_reduce_prompt(document.model, text.text, budget, usage)
+            else:
+                # The stuff chain only formats its prompt with the document text, so
+                # streaming from the model with the same prompt gives the same summary
+                prompt = self.prompt_template.format(text=text.text)
+            pieces = []
+            async for chunk in llm.astream(prompt):
+                if not isinstance(chunk.content, str) or not chunk.content:
+                    continue
+                if not pieces:
+                    span.set_attribute("summary.time_to_first_token_ms", int((time.perf_counter() - start) * 1000))
+                pieces.append(chunk.content)
+                yield CachedSummary(chunk.content, "generated")
+
+            generation_time_ms = int((time.perf_counter() - start) * 1000)
+            summary = "".join(pieces).strip()
+            usage.add(prompt, summary)
+            span.set_attribute("summary.generation_ms", generation_time_ms)
+            self._set_usage_attributes(span, usage)
+            await self.summary_cache.store(key, summary, generation_time_ms)
+            await self._store_by_source(document, summary)
+
+    def _chain(self, model: LLMModel) -> BaseCombineDocumentsChain:
+        chain = self._chains.get(model)
+        if chain is None:
+            chain = self._chains[model] = load_summarize_chain(
+                llm=self.llm_config.get_llm(model),
+                chain_type="stuff",
+                prompt=self.prompt_template,
+                document_variable_name="text",  # This tells the chain to use "text" as the variable name
+                verbose=False
+            )
+        return chain
+
+    async def aclose(self) -> None:
+        """
+        Drop the cached chains and close the LLM clients' connection pools
+        """
+        self._chains.clear()
+        await self.llm_config.aclose()
+
+    def _strategy(self, budget: TokenBudget, text_tokens: int) -> str:
+        """
+        Stuff texts that fit in one prompt, map-reduce longer ones
+        """
+        max_tokens = self._text_budget(budget, self.prompt_template)
+        if self.stuff_max_tokens is not None:
+            max_tokens = min(max_tokens, self.stuff_max_tokens)
+        if text_tokens <= max_tokens:
+            return STUFF
+        return MAP_REDUCE
+
+    @staticmethod
+    def _text_budget(budget: TokenBudget, prompt: PromptTemplate) -> int:
+        """
+        Tokens of text that fit in the prompt for the budget's model
+        """
+        return budget.text_tokens(budget.counter.count(prompt.template.replace("{text}", "")))
+
+    @staticmethod
+    def _set_text_attributes(span, budget: TokenBudget, text) -> None:
+        span.set_attribute("summary.text_tokens", text.tokens)
+        span.set_attribute("summary.trimmed", text.trimmed)
+        span.set_attribute("summary.tokens_exact", budget.counter.exact)
+
+    @staticmethod
+    def _set_usage_attributes(span, usage: _TokenUsage) -> None:
+        # Only set when the LLM was called, not for cached summaries
+        if usage.calls:
+            span.set_attribute("summary.llm_calls", usage.calls)
+            span.set_attribute("summary.input_tokens", usage.input_tokens)
+            span.set_attribute("summary.output_tokens", usage.output_tokens)
+
+    def _source_key(self, document: Document) -> Optional[SummaryKey]:
+        """
+        Key of the summary of the document's PDF by its url and updated_at, or None
+        for documents without a PDF
+        """
+        if not document.url:
+            return None
+        return SummaryKey(
+            document_id=document.id,
+            model=getattr(document.model, "value", document.model),
+            content_sha256=hashlib.sha256(f"{document.url}\0{document.updated_at.isoformat()}".encode()).hexdigest(),
+            prompt_version=self.source_prompt_version
+        )
+
+    async def _store_by_source(self, document: Document, summary_text: str) -> None:
+        key = self._source_key(document)
+        if key is not None:
+            await self.summary_cache.store(key, summary_text)
+
+    def _summary_key(self, document: Document, text_to_summarize: str, strategy: str) -> SummaryKey:
+        return SummaryKey(
+            document_id=document.id,
+            model=getattr(document.model, "value", document.model),
+            content_sha256=hashlib.sha256(text_to_summarize.encode()).hexdigest(),
+            prompt_version=self.prompt_versions[strategy]
+        )
+
+    async def _generate(
+        self, document: Document, text_to_summarize: str, strategy: str,
+        budget: TokenBudget, usage: _TokenUsage
+    ) -> tuple[str, int]:
+        """
+        Call the LLM
+        Returns a tuple of (summary, generation time in milliseconds)
+        """
+        start = time.perf_counter()
+
         # Create LangChain document
         doc = LangChainDocument(
             page_content=text_to_summarize,
@@ -53,26 +330,83 @@ class DocumentSummarizer:
             }
         )
         
-        # Get the LLM instance for the selected model
-        llm = self.llm_config.get_llm(document.model)
-        
-        # Create the chain for this request
-        chain = load_summarize_chain(
-            llm=llm,
-            chain_type="stuff",
-            prompt=self.prompt_template,
-            document_variable_name="text",  # This tells the chain to use "text" as the variable name
-            verbose=False
-        )
-        
         # Generate summary
         try:
-            result = await chain.ainvoke({"input_documents": [doc]})  # Keep this as input_documents
-            summary = result.get("output_text", "")
-            return summary.strip()
+            if strategy == MAP_REDUCE:
+                prompt = await self._map_reduce_prompt(document.model, doc.page_content, budget, usage)
+                summary = await self._complete(document.model, prompt, usage)
+            else:
+                chain = self._chain(document.model)
+                result = await chain.ainvoke({"input_documents": [doc]})  # Keep this as input_documents
+                summary = result.get("output_text", "")
+                usage.add(self.prompt_template.format(text=doc.page_content), summary)
+            return summary.strip(), int((time.perf_counter() - start) * 1000)
         except Exception as e:
             print(f"Error during summarization: {str(e)}")
             raise
+
+    async def _map_reduce_prompt(
+        self, model: LLMModel, text_to_summarize: str, budget: TokenBudget, usage: _TokenUsage
+    ) -> str:
+        """
+        Summarize the chunks of a long text concurrently, then collapse the chunk
+        summaries until they fit in one prompt
+        Returns the prompt that combines them into the final summary
+        """
+        with tracer.start_as_current_span("summarize.map") as span:
+            # Chunks and combined summaries are kept within chunk_tokens and within
+            # what fits in the map and combine prompts of this model
+            text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=min(self.chunk_tokens, self._text_budget(budget, self.map_prompt)),
+                chunk_overlap=self.chunk_overlap,
+                length_function=budget.counter.count
+            )
+            max_tokens = min(self.chunk_tokens, self._text_budget(budget, self.combine_prompt))
+            chunks = text_splitter.split_text(text_to_summarize)
+            span.set_attribute("summary.chunks", len(chunks))
+            summaries = await asyncio.gather(*(
+                self._complete(model, self.map_prompt.format(text=chunk), usage) for chunk in chunks
+            ))
+
+            collapse_rounds = 0
+            while len(summaries) > 1 and budget.counter.count("\n\n".join(summaries)) > max_tokens:
+                collapse_rounds += 1
+                summaries = await asyncio.gather(*(
+                    self._complete(model, self.combine_prompt.format(text="\n\n".join(group)), usage)
+                    for group in self._collapse_groups(summaries, budget.counter, max_tokens)
+                ))
+            span.set_attribute("summary.collapse_rounds", collapse_rounds)
+        return self.combine_prompt.format(text="\n\n".join(summaries))
+
+    @staticmethod
+    def _collapse_groups(summaries: List[str], counter: TokenCounter, max_tokens: int) -> List[List[str]]:
+        """
+        Consecutive summaries grouped to about max_tokens each. Every group but
+        the last has at least two summaries, so each round shrinks the list
+        """
+        groups: List[List[str]] = [[]]
+        size = 0
+        for summary in summaries:
+            tokens = counter.count(summary)
+            if len(groups[-1]) >= 2 and size + tokens > max_tokens:
+                groups.append([])
+                size = 0
+            groups[-1].append(summary)
+            size += tokens
+        return groups
+
+    async def _complete(self, model: LLMModel, prompt: str, usage: _TokenUsage) -> str:
+        """
+        One LLM call, holding one of the provider's map slots
+        """
+        provider = self.llm_config.provider(model)
+        slots = self._map_slots.get(provider)
+        if slots is None:
+            slots = self._map_slots[provider] = asyncio.Semaphore(self.map_concurrency)
+        async with slots:
+            message = await self.llm_config.get_llm(model).ainvoke(prompt)
+        usage.add(prompt, message.content)
+        return message.content.strip()
     
     def _prepare_text(self, document: Document) -> str:
         """
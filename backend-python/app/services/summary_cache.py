@@ -0,0 +1,144 @@
+import logging
+import os
+from typing import Awaitable, Callable, NamedTuple, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from .cache import LoadingCache
+from .database import Database, _env_flag
+
+logger = logging.getLogger(__name__)
+
+SELECT_SUMMARY = text("""
+    SELECT summary_text FROM document_summaries
+    WHERE document_id = :document_id AND model = :model
+      AND content_sha256 = :content_sha256 AND prompt_version = :prompt_version
+""")
+INSERT_SUMMARY = text("""
+    INSERT INTO document_summaries (document_id, model, content_sha256, prompt_version, summary_text, generation_time_ms)
+    VALUES (:document_id, :model, :content_sha256, :prompt_version, :summary_text, :generation_time_ms)
+    ON CONFLICT (document_id, model, content_sha256, prompt_version) DO NOTHING
+""")
+
+class SummaryKey(NamedTuple):
+    """Everything a summary depends on"""
+    document_id: str
+    model: str
+    # SHA-256 of the text sent to the model, or of the PDF's url and updated_at
+    # for summaries looked up before the PDF is downloaded
+    content_sha256: str
+    # Hash of the prompt templates, so editing a prompt misses every old entry
+    prompt_version: str
+
+class CachedSummary(NamedTuple):
+    summary_text: str
+    # Where the summary came from: memory, database or generated
+    source: str
+
+    @property
+    def cache_hit(self) -> bool:
+        return self.source != "generated"
+
+class SummaryCache:
+    """
+    Two-level cache of generated summaries.
+
+    L1 is an in-process LoadingCache, which also makes concurrent requests for the
+    same summary share one LLM call. L2 is the document_summaries table, shared by
+    every instance and kept across restarts. Failures to read or write L2 are logged
+    and treated as misses, so they never fail a summary.
+    """
+    def __init__(self, database: Optional[Database] = None):
+        self.memory: LoadingCache[CachedSummary] = LoadingCache(
+            name="summaries",
+            max_bytes=int(os.getenv("SUMMARY_CACHE_MAX_BYTES", 16 * 1024 * 1024)),
+            ttl_seconds=float(os.getenv("SUMMARY_CACHE_TTL", 24 * 60 * 60)),
+            # Never refresh in the background: a refresh is another LLM call
+            refresh_ratio=1.0,
+            sizeof=lambda summary: 128 + len(summary.summary_text.encode())
+        )
+        self.database = database if _env_flag("SUMMARY_CACHE_PERSIST", True) else None
+
+    async def get_or_generate(self, key: SummaryKey,
+                              generate: Callable[[], Awaitable[tuple[str, int]]],
+                              alias: Optional[SummaryKey] = None) -> CachedSummary:
+        """
+        Return the cached summary for ``key``, generating and storing it on a miss
+
+        Args:
+            key: Cache key of the summary
+            generate: Produces (summary_text, generation_time_ms)
+            alias: Another key to store the summary under when it is read from the
+                database or generated; memory hits and coalesced callers skip it
+        """
+        async def load() -> CachedSummary:
+            summary_text = await self._load_persisted(key)
+            if summary_text is not None:
+                summary = CachedSummary(summary_text, "database")
+            else:
+                summary_text, generation_time_ms = await generate()
+                await self._persist(key, summary_text, generation_time_ms)
+                summary = CachedSummary(summary_text, "generated")
+            if alias is not None:
+                await self.store(alias, summary_text)
+            return summary
+
+        if not self.memory.enabled:
+            return await load()
+        summary, outcome = await self.memory.get_or_load(key, load)
+        if outcome in ("hit", "refresh"):
+            return CachedSummary(summary.summary_text, "memory")
+        return summary
+
+    async def lookup(self, key: SummaryKey) -> Optional[CachedSummary]:
+        """
+        Return the cached summary for ``key`` from either level without generating it, or None
+        """
+        if self.memory.enabled:
+            summary = self.memory.get(key)
+            if summary is not None:
+                return CachedSummary(summary.summary_text, "memory")
+        summary_text = await self._load_persisted(key)
+        if summary_text is None:
+            return None
+        summary = CachedSummary(summary_text, "database")
+        self.memory.put(key, summary)
+        return summary
+
+    async def store(self, key: SummaryKey, summary_text: str, generation_time_ms: Optional[int] = None) -> None:
+        """
+        Cache a summary generated outside of get_or_generate, such as a streamed one,
+        or an existing summary under another key
+        """
+        self.memory.put(key, CachedSummary(summary_text, "generated"))
+        await self._persist(key, summary_text, generation_time_ms)
+
+    async def _load_persisted(self, key: SummaryKey) -> Optional[str]:
+        if self.database is None:
+            return None
+        try:
+            return await self.database.run(self._execute_select, key)
+        except Exception as e:
+            logger.warning(f"could not read cached summary for {key.document_id}: {e}")
+            return None
+
+    async def _persist(self, key: SummaryKey, summary_text: str, generation_time_ms: Optional[int]) -> None:
+        if self.database is None:
+            return
+        try:
+            await self.database.run(self._execute_insert, key, summary_text, generation_time_ms)
+        except Exception as e:
+            logger.warning(f"could not store summary for {key.document_id}: {e}")
+
+    @staticmethod
+    def _execute_select(conn: Connection, key: SummaryKey) -> Optional[str]:
+        return conn.execute(SELECT_SUMMARY, key._asdict()).scalar()
+
+    @staticmethod
+    def _execute_insert(conn: Connection, key: SummaryKey, summary_text: str,
+                        generation_time_ms: Optional[int]) -> None:
+        conn.execute(INSERT_SUMMARY, {
+            **key._asdict(),
+            "summary_text": summary_text,
+            "generation_time_ms": generation_time_ms
+        })
+        conn.commit()
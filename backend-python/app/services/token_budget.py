@@ -0,0 +1,117 @@
+import logging
+import math
+from typing import NamedTuple, Optional
+
+try:
+    import tiktoken
+except ImportError:
+    # Optional; without it tokens are estimated from text length
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Rough average for English text, used when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+# Encoding used for models tiktoken does not know, such as Claude
+DEFAULT_ENCODING = "cl100k_base"
+
+# Tokens kept free besides the prompt and the output, for the chat message framing
+# and the error of approximate counts
+SAFETY_MARGIN = 0.05
+
+class TrimmedText(NamedTuple):
+    text: str
+    # Tokens of text, and of the original text before trimming
+    tokens: int
+    original_tokens: int
+
+    @property
+    def trimmed(self) -> bool:
+        return self.tokens < self.original_tokens
+
+class TokenCounter:
+    """
+    Counts tokens with a model's tiktoken encoding, scaled by ``scale`` for models
+    whose own tokenizer is not public and tends to produce more tokens.
+
+    The encoding is loaded on first use (tiktoken downloads it once and caches it).
+    If tiktoken is not installed or the encoding cannot be loaded, tokens are
+    estimated at CHARS_PER_TOKEN characters each.
+    """
+    def __init__(self, model_name: Optional[str] = None, scale: float = 1.0):
+        self.model_name = model_name
+        self.scale = scale
+        self._encoding = None
+        self._loaded = False
+
+    @property
+    def exact(self) -> bool:
+        """Whether counts come from a tokenizer rather than the character estimate"""
+        return self.load() is not None
+
+    def load(self):
+        """
+        Load the encoding, or None when falling back to the estimate. Loading may
+        download the encoding, so call this outside the event loop first.
+        """
+        if not self._loaded:
+            self._loaded = True
+            if tiktoken is None:
+                logger.warning("tiktoken is not installed; estimating tokens from text length")
+            else:
+                try:
+                    self._encoding = self._get_encoding()
+                except Exception as e:
+                    logger.warning(f"could not load the tokenizer for {self.model_name}, estimating tokens from text length: {e}")
+        return self._encoding
+
+    def _get_encoding(self):
+        if self.model_name:
+            try:
+                return tiktoken.encoding_for_model(self.model_name)
+            except KeyError:
+                pass
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+    def count(self, text: str) -> int:
+        encoding = self.load()
+        if encoding is None:
+            return math.ceil(len(text) / CHARS_PER_TOKEN)
+        return math.ceil(len(encoding.encode(text, disallowed_special=())) * self.scale)
+
+    def trim(self, text: str, max_tokens: int) -> TrimmedText:
+        """
+        Cut ``text`` to at most ``max_tokens`` tokens, keeping its beginning
+        """
+        encoding = self.load()
+        if encoding is None:
+            tokens = math.ceil(len(text) / CHARS_PER_TOKEN)
+            if tokens <= max_tokens:
+                return TrimmedText(text, tokens, tokens)
+            return TrimmedText(text[:max_tokens * CHARS_PER_TOKEN], max_tokens, tokens)
+
+        encoded = encoding.encode(text, disallowed_special=())
+        tokens = math.ceil(len(encoded) * self.scale)
+        if tokens <= max_tokens:
+            return TrimmedText(text, tokens, tokens)
+        kept = encoded[:int(max_tokens / self.scale)]
+        return TrimmedText(encoding.decode(kept), math.ceil(len(kept) * self.scale), tokens)
+
+class TokenBudget:
+    """
+    How much text one prompt to a model can carry: the context window minus the
+    tokens reserved for the output, the prompt template around the text, and a
+    safety margin.
+    """
+    def __init__(self, counter: TokenCounter, context_window: int, output_tokens: int):
+        self.counter = counter
+        self.context_window = context_window
+        self.output_tokens = output_tokens
+
+    def text_tokens(self, template_tokens: int) -> int:
+        """
+        Tokens of text that fit in a prompt whose template takes ``template_tokens``
+        """
+        available = self.context_window * (1 - SAFETY_MARGIN) - self.output_tokens - template_tokens
+        return max(int(available), 0)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Concurrent search + summary throughput benchmark
+
+Runs a mix of /v1/search and /v1/summary requests against a running service
+and reports throughput and latency percentiles per endpoint. Start the service
+once with DATABASE_ASYNC=false and once with DATABASE_ASYNC=true and compare.
+
+Searches are sent with use_cache false so they reach the database. Start the
+service with SEARCH_COUNT_CACHE_TTL=0 so exact counts are not cached either, and
+with SUMMARY_CACHE_MAX_BYTES=0 SUMMARY_CACHE_PERSIST=false to measure summaries
+rather than the summary cache.
+
+    python benchmarks/concurrent_search_summary.py --url http://localhost:5002 \\
+        --concurrency 32 --duration 30 --summary-ratio 0.1 --doc-id 40047282
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import defaultdict
+
+import aiohttp
+
+SEARCH_TERMS = [
+    "climate", "education", "health", "energy", "water", "agriculture",
+    "poverty", "infrastructure", "finance", "governance", "trade", "urban",
+]
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def worker(session, args, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        if args.doc_id and random.random() < args.summary_ratio:
+            endpoint = "summary"
+            payload = {"ids": [random.choice(args.doc_id)]}
+        else:
+            endpoint = "search"
+            payload = {
+                "search_text": random.choice(SEARCH_TERMS),
+                "max_results": args.max_results,
+                "use_cache": False
+            }
+
+        start = time.perf_counter()
+        try:
+            async with session.post(f"{args.url}/v1/{endpoint}", json=payload) as response:
+                await response.read()
+                if response.status != 200:
+                    errors[endpoint] += 1
+                    continue
+        except aiohttp.ClientError:
+            errors[endpoint] += 1
+            continue
+        latencies[endpoint].append((time.perf_counter() - start) * 1000)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:5002")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run")
+    parser.add_argument("--max-results", type=int, default=3)
+    parser.add_argument("--summary-ratio", type=float, default=0.1, help="Fraction of requests sent to /v1/summary")
+    parser.add_argument("--doc-id", action="append", default=[], help="Document id for summary requests (repeatable)")
+    args = parser.parse_args()
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        deadline = time.perf_counter() + args.duration
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            worker(session, args, deadline, latencies, errors) for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+
+    print(f"{'endpoint':<10} {'ok':>7} {'err':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'mean ms':>8}")
+    for endpoint in ("search", "summary"):
+        values = latencies[endpoint]
+        if not values and not errors[endpoint]:
+            continue
+        print(
+            f"{endpoint:<10} {len(values):>7} {errors[endpoint]:>5} {len(values) / elapsed:>8.1f} "
+            f"{percentile(values, 50):>8.1f} {percentile(values, 95):>8.1f} {percentile(values, 99):>8.1f} "
+            f"{(statistics.mean(values) if values else 0):>8.1f}"
+        )
+
+if __name__ == "__main__":
+    asyncio.run(main())
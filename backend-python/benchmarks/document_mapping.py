@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Per-row cost of turning database rows into a /v1/search response body
+
+Compares, for result sets of 3, 100 and 10k rows:
+
+  validated - Document(...) with full validation per row, then FastAPI's
+              response_model validation and jsonable encoding (the previous path)
+  construct - DocumentSearchService._row_to_document (model_construct, no
+              per-row validation) and ModelResponse, which skips revalidating
+              the response, as the /v1/search endpoint now does
+
+No database is needed; rows are synthetic tuples shaped like the search query's rows.
+
+    python benchmarks/document_mapping.py --repeat 20
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from collections import namedtuple
+from datetime import date, datetime
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.models import Document, DocumentSearchResponse  # noqa: E402
+from app.responses import ModelResponse  # noqa: E402
+from app.services.document_search import DOCUMENT_COLUMNS, DocumentSearchService  # noqa: E402
+
+SearchRow = namedtuple("SearchRow", list(DOCUMENT_COLUMNS))
+
+def make_rows(count):
+    return [
+        SearchRow(
+            id=str(40000000 + i),
+            title=f"Sample project document {i} - Procurement Plan",
+            document_date=date(2024, 1 + i % 12, 1 + i % 28),
+            abstract="The development objective of the project is to improve access to services. " * 12,
+            document_type="Procurement Plan",
+            major_document_type="Project Documents",
+            volume_number=1,
+            total_volume_number=1,
+            url=f"https://documents.worldbank.org/curated/en/{i}/sample.pdf",
+            language="English",
+            country="India",
+            author=None,
+            publisher=None,
+            created_at=datetime(2025, 9, 18, 12, 0, i % 60),
+            updated_at=datetime(2025, 9, 18, 12, 0, i % 60),
+        )
+        for i in range(count)
+    ]
+
+def validated_document(row):
+    return Document(
+        id=row.id,
+        title=row.title,
+        abstract=row.abstract,
+        document_date=row.document_date,
+        document_type=row.document_type,
+        major_document_type=row.major_document_type,
+        volume_number=row.volume_number,
+        total_volume_number=row.total_volume_number,
+        url=row.url,
+        language=row.language,
+        country=row.country,
+        author=row.author,
+        publisher=row.publisher,
+        created_at=row.created_at,
+        updated_at=row.updated_at
+    )
+
+RESPONSE_FIELD = create_response_field(name="Response_search", type_=DocumentSearchResponse)
+
+async def validated(rows):
+    response = DocumentSearchResponse(
+        results=[validated_document(row) for row in rows],
+        result_count=len(rows),
+        search_time_ms=1
+    )
+    content = await serialize_response(field=RESPONSE_FIELD, response_content=response, is_coroutine=True)
+    return JSONResponse(content).body
+
+async def construct(rows):
+    response = DocumentSearchResponse(
+        results=[DocumentSearchService._row_to_document(row) for row in rows],
+        result_count=len(rows),
+        search_time_ms=1
+    )
+    return ModelResponse(response).body
+
+async def measure(fn, rows, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn(rows)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'rows':>6} {'path':<10} {'total ms':>9} {'us/row':>8}")
+    for count in (3, 100, 10_000):
+        rows = make_rows(count)
+        if await validated(rows) != await construct(rows):
+            raise SystemExit(f"response bodies differ for {count} rows")
+        for name, fn in (("validated", validated), ("construct", construct)):
+            seconds = await measure(fn, rows, args.repeat)
+            print(f"{count:>6} {name:<10} {seconds * 1000:>9.2f} {seconds / count * 1e6:>8.1f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Per-request overhead of building LLM clients and summarize chains
+
+Starts a local stub that answers OpenAI chat completions and Anthropic messages
+after --latency ms, then runs the same summaries two ways:
+
+  rebuild - a new ChatOpenAI/ChatAnthropic and summarize chain per request,
+            as the summarizer used to do
+  reuse   - DocumentSummarizer's cached chain on LLMConfig's shared client
+            and keep-alive connection pool
+
+and reports latency above the stub's own delay, and how many TCP connections
+the stub accepted. The stub speaks plain HTTP; against the real providers every
+new connection also pays a TLS handshake, so the saving there is larger.
+No database or API keys are needed.
+
+    python benchmarks/llm_client_reuse.py --requests 200 --concurrency 8 --latency 20
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+SUMMARY = "The project aims to improve access to water services in rural areas."
+
+def stub_app(latency, connections):
+    async def delay(request):
+        connections.add(request.transport.get_extra_info("peername"))
+        await asyncio.sleep(latency)
+
+    async def chat_completions(request):
+        body = await request.json()
+        await delay(request)
+        return web.json_response({
+            "id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": SUMMARY}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 15, "total_tokens": 115},
+        })
+
+    async def messages(request):
+        body = await request.json()
+        await delay(request)
+        return web.json_response({
+            "id": "msg_stub", "type": "message", "role": "assistant", "model": body["model"],
+            "content": [{"type": "text", "text": SUMMARY}],
+            "stop_reason": "end_turn", "stop_sequence": None,
+            "usage": {"input_tokens": 100, "output_tokens": 15},
+        })
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_post("/v1/messages", messages)
+    return app
+
+async def run(summarize, requests, concurrency):
+    timings = []
+    queue = asyncio.Queue()
+    for index in range(requests):
+        queue.put_nowait(index)
+
+    async def worker():
+        while not queue.empty():
+            queue.get_nowait()
+            start = time.perf_counter()
+            await summarize()
+            timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return timings, time.perf_counter() - start
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=20, help="stub response delay in ms")
+    parser.add_argument("--port", type=int, default=8799)
+    args = parser.parse_args()
+
+    connections = set()
+    runner = web.AppRunner(stub_app(args.latency / 1000, connections), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+
+    os.environ["OPENAI_API_KEY"] = os.environ["ANTHROPIC_API_KEY"] = "stub"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ["ANTHROPIC_BASE_URL"] = f"http://127.0.0.1:{args.port}"
+
+    from langchain.chains.summarize import load_summarize_chain
+    from langchain.docstore.document import Document as LangChainDocument
+    from app.models import LLMModel
+    from app.services.summarizer import DocumentSummarizer
+
+    summarizer = DocumentSummarizer()
+    openai_models = (LLMModel.GPT35_TURBO, LLMModel.GPT4_TURBO)
+    document = LangChainDocument(page_content="Title: Rural water supply\n\n" + SUMMARY * 20)
+
+    def rebuild(model):
+        async def summarize():
+            config = summarizer.llm_config.model_configs[model]
+            llm = config.model_class(**config.settings.model_dump())
+            chain = load_summarize_chain(
+                llm=llm,
+                chain_type="stuff",
+                prompt=summarizer.prompt_template,
+                document_variable_name="text"
+            )
+            try:
+                await chain.ainvoke({"input_documents": [document]})
+            finally:
+                # The summarizer left these to the garbage collector, which closes
+                # them at unpredictable points; close them here to keep runs stable
+                client = llm.async_client._client if model in openai_models else llm._async_client
+                await client.close()
+        return summarize
+
+    def reuse(model):
+        async def summarize():
+            await summarizer._chain(model).ainvoke({"input_documents": [document]})
+        return summarize
+
+    print(f"{'model':<20} {'mode':<8} {'p50 ms':>8} {'p95 ms':>8} {'overhead ms':>12} {'req/s':>8} {'conns':>6}")
+    try:
+        for model in (LLMModel.GPT35_TURBO, LLMModel.CLAUDE_3_SONNET):
+            for mode, make in (("rebuild", rebuild), ("reuse", reuse)):
+                summarize = make(model)
+                await summarize()
+                connections.clear()
+                timings, elapsed = await run(summarize, args.requests, args.concurrency)
+                timings.sort()
+                p50 = statistics.median(timings) * 1000
+                p95 = timings[int(0.95 * (len(timings) - 1))] * 1000
+                print(
+                    f"{model.value:<20} {mode:<8} {p50:>8.2f} {p95:>8.2f} {p50 - args.latency:>12.2f} "
+                    f"{args.requests / elapsed:>8.1f} {len(connections):>6}"
+                )
+    finally:
+        await summarizer.aclose()
+        await runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main())
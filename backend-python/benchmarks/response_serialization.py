@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Response encoding cost for /v1/search and /v1/summary bodies
+
+Compares, for search responses of 3, 100 and 10k documents and a summary response:
+
+  fastapi        - FastAPI's default path for a returned model: response_model
+                   validation, jsonable_encoder and json.dumps (JSONResponse)
+  model_dump_json - pydantic-core's own JSON encoder
+  orjson         - ModelResponse (model_dump + orjson), used by the endpoints
+
+Every encoder must produce the same bytes; the benchmark stops if they differ.
+No database is needed.
+
+    python benchmarks/response_serialization.py --repeat 20
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.models import DocumentSearchResponse, DocumentSummaryResponse  # noqa: E402
+from app.responses import ModelResponse  # noqa: E402
+from app.services.document_search import DocumentSearchService  # noqa: E402
+from document_mapping import make_rows  # noqa: E402
+
+def fastapi_encoder(model):
+    field = create_response_field(name="Response", type_=type(model))
+
+    async def encode():
+        content = await serialize_response(field=field, response_content=model, is_coroutine=True)
+        return JSONResponse(content).body
+    return encode
+
+def model_dump_json_encoder(model):
+    async def encode():
+        return model.model_dump_json().encode()
+    return encode
+
+def orjson_encoder(model):
+    async def encode():
+        return ModelResponse(model).body
+    return encode
+
+ENCODERS = {
+    "fastapi": fastapi_encoder,
+    "model_dump_json": model_dump_json_encoder,
+    "orjson": orjson_encoder,
+}
+
+def responses():
+    for count in (3, 100, 10_000):
+        yield f"search {count}", count, DocumentSearchResponse(
+            results=[DocumentSearchService._row_to_document(row) for row in make_rows(count)],
+            result_count=count,
+            search_time_ms=12
+        )
+    yield "summary", 1, DocumentSummaryResponse(
+        summary_text="The project aims to improve access to water services in rural areas. " * 40,
+        summary_time_ms=1830
+    )
+
+async def measure(encode, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await encode()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'response':<14} {'encoder':<16} {'total ms':>9} {'us/doc':>8} {'KiB':>8}")
+    for name, count, model in responses():
+        encoders = {label: make(model) for label, make in ENCODERS.items()}
+        bodies = {label: await encode() for label, encode in encoders.items()}
+        if len(set(bodies.values())) != 1:
+            raise SystemExit(f"encoders disagree for {name}")
+        size = len(bodies["fastapi"]) / 1024
+        for label, encode in encoders.items():
+            seconds = await measure(encode, args.repeat)
+            print(f"{name:<14} {label:<16} {seconds * 1000:>9.3f} {seconds / count * 1e6:>8.1f} {size:>8.1f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Search latency per count strategy and filter combination
+
+Calls DocumentSearchService directly (no HTTP) against DATABASE_URL with each
+SEARCH_COUNT_STRATEGY and prints the median latency per filter combination.
+The result and exact-count caches are bypassed so every search runs its queries.
+Use --seed to grow the documents table to a target size first by cloning the
+existing rows under 'bench-' ids, and --cleanup to remove them afterwards.
+
+    DATABASE_URL=postgresql://... python benchmarks/search_count_strategies.py --seed 1000000
+    DATABASE_URL=postgresql://... python benchmarks/search_count_strategies.py --cleanup
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+# Measure the count queries themselves, not the exact-count cache
+os.environ["SEARCH_COUNT_CACHE_TTL"] = "0"
+
+from app.models import DocumentSearchRequest  # noqa: E402
+from app.services.database import Database  # noqa: E402
+from app.services.document_search import COUNT_STRATEGIES, DocumentSearchService  # noqa: E402
+
+FILTER_COMBINATIONS = {
+    "no filters": DocumentSearchRequest(),
+    "search_text": DocumentSearchRequest(search_text="climate"),
+    "search_text + country": DocumentSearchRequest(search_text="climate", country="India"),
+    "title": DocumentSearchRequest(title="report"),
+    "language": DocumentSearchRequest(language="English"),
+    "language + country": DocumentSearchRequest(language="English", country="India"),
+    "doc_type + major_document_type": DocumentSearchRequest(doc_type="Report", major_document_type="Reports"),
+    "search_text + dates": DocumentSearchRequest(
+        search_text="water", start_date="2000-01-01T00:00:00", end_date="2030-01-01T00:00:00"
+    ),
+}
+
+def seed(conn, target_rows: int) -> None:
+    base = conn.execute(text("SELECT COUNT(*) FROM documents WHERE id NOT LIKE 'bench-%'")).scalar()
+    current = conn.execute(text("SELECT COUNT(*) FROM documents")).scalar()
+    if not base or current >= target_rows:
+        return
+    copies = -(-target_rows // base) - 1
+    print(f"seeding {copies} copies of {base} documents...")
+    conn.execute(text("""
+        INSERT INTO documents (id, title, docdt, abstract, content_text, docty, majdocty,
+                               volnb, totvolnb, url, lang, country, author, publisher)
+        SELECT 'bench-' || c || '-' || d.id, d.title, d.docdt, d.abstract, d.content_text, d.docty, d.majdocty,
+               d.volnb, d.totvolnb, d.url, d.lang, d.country, d.author, d.publisher
+        FROM generate_series(1, :copies) AS c
+        CROSS JOIN documents d
+        WHERE d.id NOT LIKE 'bench-%'
+        ON CONFLICT (id) DO NOTHING
+    """), {"copies": copies})
+    conn.execute(text("ANALYZE documents"))
+    conn.commit()
+
+def cleanup(conn) -> None:
+    conn.execute(text("DELETE FROM documents WHERE id LIKE 'bench-%'"))
+    conn.commit()
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0, help="Grow the documents table to this many rows")
+    parser.add_argument("--cleanup", action="store_true", help="Delete seeded rows and exit")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--max-results", type=int, default=3)
+    args = parser.parse_args()
+
+    database = Database()
+    if args.cleanup:
+        await database.run(cleanup)
+        return
+    if args.seed:
+        await database.run(seed, args.seed)
+    total = await database.run(lambda conn: conn.execute(text("SELECT COUNT(*) FROM documents")).scalar())
+    print(f"documents: {total}, iterations: {args.iterations}, max_results: {args.max_results}\n")
+
+    services = {strategy: DocumentSearchService(database, count_strategy=strategy) for strategy in COUNT_STRATEGIES}
+    print(f"{'filters':<34}" + "".join(f"{strategy + ' ms':>16}" for strategy in COUNT_STRATEGIES))
+    for name, request in FILTER_COMBINATIONS.items():
+        request = request.model_copy(update={"max_results": args.max_results, "use_cache": False})
+        medians = []
+        for strategy, service in services.items():
+            await service.search_documents(request)  # warm the pool and plans
+            timings = []
+            for _ in range(args.iterations):
+                start = time.perf_counter()
+                await service.search_documents(request)
+                timings.append((time.perf_counter() - start) * 1000)
+            medians.append(statistics.median(timings))
+        print(f"{name:<34}" + "".join(f"{median:>16.2f}" for median in medians))
+
+    await database.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
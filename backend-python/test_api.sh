@@ -60,6 +60,14 @@ else
     echo -e "${RED}No document ID found in search results${NC}"
 fi
 
+# Test 2b: Search with timezone-aware dates
+print_header "Test 2b: Search with timezone-aware date filters"
+call_api "POST" "/search" '{
+    "start_date": "2020-01-01T00:00:00Z",
+    "end_date": "2023-12-31T23:59:59+02:00",
+    "max_results": 1
+}'
+
 # Test 3: Error handling - Invalid document ID
 print_header "Test 3: Test error handling with invalid document ID"
 call_api "POST" "/summary" '{
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from app.services.batcher import BatchLoader
+
+class Recorder:
+    """
+    load_many that records each batch and returns the key doubled, skipping "missing"
+    """
+    def __init__(self, delay: float = 0.0):
+        self.batches = []
+        self.delay = delay
+
+    async def __call__(self, keys):
+        self.batches.append(sorted(keys))
+        await asyncio.sleep(self.delay)
+        return {key: key * 2 for key in keys if key != "missing"}
+
+def test_concurrent_loads_share_one_batch():
+    async def scenario():
+        load_many = Recorder()
+        loader = BatchLoader("test", load_many, max_batch_size=10, max_wait_ms=5)
+        results = await asyncio.gather(loader.load("a"), loader.load("b"), loader.load("a"), loader.load("missing"))
+        return results, load_many.batches
+
+    results, batches = asyncio.run(scenario())
+    assert results == ["aa", "bb", "aa", None]
+    assert batches == [["a", "b", "missing"]]
+
+def test_full_batch_dispatches_without_waiting():
+    async def scenario():
+        load_many = Recorder()
+        loader = BatchLoader("test", load_many, max_batch_size=2, max_wait_ms=60_000)
+        results = await asyncio.wait_for(asyncio.gather(*(loader.load(key) for key in "abcd")), 1)
+        return results, load_many.batches
+
+    results, batches = asyncio.run(scenario())
+    assert results == ["aa", "bb", "cc", "dd"]
+    assert batches == [["a", "b"], ["c", "d"]]
+
+def test_lookup_joins_batch_in_flight():
+    async def scenario():
+        load_many = Recorder(delay=0.05)
+        loader = BatchLoader("test", load_many, max_batch_size=10, max_wait_ms=0)
+        first = asyncio.ensure_future(loader.load("a"))
+        await asyncio.sleep(0.01)
+        second = await loader.load("a")
+        return await first, second, load_many.batches
+
+    first, second, batches = asyncio.run(scenario())
+    assert first == second == "aa"
+    assert batches == [["a"]]
+
+def test_errors_reach_every_caller():
+    async def failing(keys):
+        raise RuntimeError("boom")
+
+    async def scenario():
+        loader = BatchLoader("test", failing, max_batch_size=10, max_wait_ms=1)
+        return await asyncio.gather(loader.load("a"), loader.load("b"), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert [str(result) for result in results] == ["boom", "boom"]
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+def test_cancelled_caller_does_not_cancel_shared_lookup():
+    async def scenario():
+        loader = BatchLoader("test", Recorder(delay=0.02), max_batch_size=10, max_wait_ms=1)
+        leaving = asyncio.ensure_future(loader.load("a"))
+        staying = asyncio.ensure_future(loader.load("a"))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        return await staying
+
+    assert asyncio.run(scenario()) == "aa"
+
+def test_aclose_cancels_pending_and_inflight_lookups():
+    async def scenario():
+        loader = BatchLoader("test", Recorder(delay=60), max_batch_size=1, max_wait_ms=60_000)
+        inflight = asyncio.ensure_future(loader.load("a"))
+        await asyncio.sleep(0.01)
+        loader.max_batch_size = 10
+        pending = asyncio.ensure_future(loader.load("b"))
+        await asyncio.sleep(0.01)
+        assert len(loader._tasks) == 1
+        await asyncio.wait_for(loader.aclose(), 1)
+        return inflight, pending, loader
+
+    inflight, pending, loader = asyncio.run(scenario())
+    for lookup in (inflight, pending):
+        with pytest.raises(asyncio.CancelledError):
+            lookup.result()
+    assert not loader._tasks
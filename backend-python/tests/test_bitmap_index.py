@@ -0,0 +1,74 @@
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.services.bitmap_index import BitmapIndex
+
+COLUMNS = ("country", "language")
+
+def build(rows, removed=()):
+    # A small capacity, so the bitmaps and value matrices have to grow
+    index = BitmapIndex(COLUMNS, capacity=64)
+    for values, created_at in rows:
+        index.append(values, created_at)
+    for slot in removed:
+        index.remove(slot)
+    return index
+
+def slots_of(index, mask):
+    return [slot for slot in range(index.size) if index.contains(mask, np.array([slot]))[0]]
+
+def random_rows(count, seed=7):
+    rng = random.Random(seed)
+    countries = [f"country{i}" for i in range(12)] + [None]
+    start = datetime(2020, 1, 1)
+    return [
+        (
+            {"country": rng.choice(countries), "language": rng.choice(["English", "French", None])},
+            rng.choice([None, start + timedelta(days=rng.randrange(1000))]),
+        )
+        for _ in range(count)
+    ]
+
+def test_select_matches_a_row_by_row_filter():
+    rows = random_rows(1000)
+    removed = set(range(0, 1000, 7))
+    index = build(rows, removed)
+    start, end = datetime(2020, 6, 1), datetime(2021, 6, 1)
+    for equals in ({}, {"country": "country3"}, {"country": "country3", "language": "French"}, {"language": ""}):
+        for date_range in ((None, None), (start, None), (None, end), (start, end)):
+            expected = [
+                slot for slot, (values, created_at) in enumerate(rows)
+                if slot not in removed
+                and all(not value or values[column] == value for column, value in equals.items())
+                and (date_range[0] is None or (created_at is not None and created_at >= date_range[0]))
+                and (date_range[1] is None or (created_at is not None and created_at <= date_range[1]))
+            ]
+            assert slots_of(index, index.select(equals, *date_range)) == expected
+
+def test_unknown_value_selects_nothing():
+    index = build(random_rows(10))
+    assert not index.select({"country": "nowhere"}).any()
+
+def test_counts_match_a_row_by_row_count():
+    rows = random_rows(1000)
+    removed = set(range(0, 1000, 5))
+    index = build(rows, removed)
+    mask = index.select({"language": "English"})
+    selected = [values for slot, (values, _) in enumerate(rows) if slot not in removed and values["language"] == "English"]
+    for column in COLUMNS:
+        expected = Counter(values[column] for values in selected if values[column] is not None)
+        assert index.counts(column, mask) == dict(expected)
+
+def test_from_slots_and_contains_round_trip():
+    index = build(random_rows(200))
+    slots = [0, 63, 64, 65, 199]
+    mask = index.from_slots(slots)
+    assert slots_of(index, mask) == slots
+    assert index.contains(mask, np.array(slots)).all()
+
+def test_counts_of_empty_column():
+    index = BitmapIndex(COLUMNS)
+    assert index.counts("country", index.select({})) == {}
@@ -0,0 +1,151 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import cache as cache_module
+from app.services.cache import LoadingCache, TTLCache
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # Only the cache's clock: the event loop keeps using the real one
+    monkeypatch.setattr(cache_module, "time", SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+def loading_cache(max_bytes=100, ttl_seconds=60, refresh_ratio=0.5):
+    return LoadingCache(name="test", max_bytes=max_bytes, ttl_seconds=ttl_seconds,
+                        refresh_ratio=refresh_ratio, sizeof=len)
+
+class Loader:
+    """
+    Loader returning "<key>-<call number>", counting its calls
+    """
+    def __init__(self, key, delay=0.0):
+        self.key = key
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return f"{self.key}-{self.calls}"
+
+def test_ttl_cache_expires_and_evicts_least_recently_used(clock):
+    cache = TTLCache(max_entries=2, ttl_seconds=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    clock.now += 11
+    assert cache.get("a") is None
+
+def test_ttl_cache_disabled_by_zero_ttl():
+    cache = TTLCache(max_entries=2, ttl_seconds=0)
+    cache.set("a", 1)
+    assert len(cache) == 0
+
+def test_miss_then_hit(clock):
+    async def scenario():
+        cache = loading_cache()
+        loader = Loader("a")
+        return [await cache.get_or_load("a", loader) for _ in range(2)], loader.calls
+
+    results, calls = asyncio.run(scenario())
+    assert results == [("a-1", "miss"), ("a-1", "hit")]
+    assert calls == 1
+
+def test_concurrent_misses_share_one_load(clock):
+    async def scenario():
+        cache = loading_cache()
+        loader = Loader("a", delay=0.01)
+        results = await asyncio.gather(*(cache.get_or_load("a", loader) for _ in range(3)))
+        return results, loader.calls
+
+    results, calls = asyncio.run(scenario())
+    assert results == [("a-1", "miss"), ("a-1", "coalesced"), ("a-1", "coalesced")]
+    assert calls == 1
+
+def test_stale_entry_is_served_while_refreshing(clock):
+    async def scenario():
+        cache = loading_cache(ttl_seconds=60, refresh_ratio=0.5)
+        loader = Loader("a")
+        await cache.get_or_load("a", loader)
+        clock.now += 40
+        stale = await cache.get_or_load("a", loader)
+        # Let the background refresh finish
+        await asyncio.sleep(0.01)
+        return stale, await cache.get_or_load("a", loader)
+
+    stale, refreshed = asyncio.run(scenario())
+    assert stale == ("a-1", "refresh")
+    assert refreshed == ("a-2", "hit")
+
+def test_expired_entry_is_loaded_again(clock):
+    async def scenario():
+        cache = loading_cache(ttl_seconds=60, refresh_ratio=1.0)
+        loader = Loader("a")
+        await cache.get_or_load("a", loader)
+        clock.now += 61
+        assert cache.get("a") is None
+        return await cache.get_or_load("a", loader)
+
+    assert asyncio.run(scenario()) == ("a-2", "miss")
+
+def test_size_limit_evicts_least_recently_used(clock):
+    async def scenario():
+        cache = loading_cache(max_bytes=10)
+        cache.put("a", "aaaa")
+        cache.put("b", "bbbb")
+        assert cache.get("a") == "aaaa"
+        cache.put("c", "cccc")
+        cache.put("huge", "x" * 11)
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert cache.get("b") is None
+    assert cache.get("huge") is None
+    assert (cache.get("a"), cache.get("c")) == ("aaaa", "cccc")
+    assert cache.size_bytes == 8
+
+def test_failed_load_is_not_cached(clock):
+    async def failing():
+        raise RuntimeError("boom")
+
+    async def scenario():
+        cache = loading_cache()
+        with pytest.raises(RuntimeError):
+            await cache.get_or_load("a", failing)
+        return await cache.get_or_load("a", Loader("a"))
+
+    assert asyncio.run(scenario()) == ("a-1", "miss")
+
+def test_clear_drops_entries_and_loads_in_flight(clock):
+    async def scenario():
+        cache = loading_cache()
+        cache.put("a", "old")
+        pending = asyncio.ensure_future(cache.get_or_load("b", Loader("b", delay=0.01)))
+        await asyncio.sleep(0)
+        cache.clear()
+        assert await pending == ("b-1", "miss")
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert cache.get("a") is None
+    assert cache.get("b") is None
+    assert cache.size_bytes == 0
+
+def test_disabled_cache_stores_nothing():
+    cache = loading_cache(max_bytes=0)
+    cache.put("a", "value")
+    assert not cache.enabled
+    assert cache.get("a") is None
@@ -0,0 +1,49 @@
+import base64
+import json
+from collections import namedtuple
+
+import pytest
+
+from app.services.document_search import DocumentSearchService
+
+encode_cursor = DocumentSearchService._encode_cursor
+decode_cursor = DocumentSearchService._decode_cursor
+
+RankedRow = namedtuple("RankedRow", "id title sort_key")
+Row = namedtuple("Row", "id title")
+
+def forge(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+def test_ranked_cursor_round_trips():
+    cursor = encode_cursor(RankedRow("40043809", "Water", -0.25), "abc")
+    assert "=" not in cursor
+    assert decode_cursor(cursor, "abc", ranked=True) == (-0.25, "40043809")
+
+def test_unranked_cursor_round_trips_without_sort_key():
+    cursor = encode_cursor(Row("40043809", "Water"), "abc")
+    assert decode_cursor(cursor, "abc", ranked=False) == (None, "40043809")
+
+def test_cursor_from_another_search_is_rejected():
+    cursor = encode_cursor(Row("1", "Water"), "abc")
+    with pytest.raises(ValueError, match="does not belong"):
+        decode_cursor(cursor, "def", ranked=False)
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    "",
+    forge([1, 2]),
+    forge({"f": "abc"}),
+    forge({"f": "abc", "id": 5}),
+    forge({"f": "abc", "id": None}),
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor, "abc", ranked=False)
+
+@pytest.mark.parametrize("sort_key", [None, "0.5", True, [1]])
+def test_ranked_cursor_needs_a_numeric_sort_key(sort_key):
+    cursor = forge({"f": "abc", "id": "1", "k": sort_key})
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor, "abc", ranked=True)
@@ -0,0 +1,36 @@
+import os
+import socket
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from app.services.database import Database
+
+def _closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def test_sync_engine_reaches_the_driver(monkeypatch):
+    # Nothing listens on the port, so pg8000 fails to connect; connect_args it
+    # does not accept would fail with a TypeError before that
+    monkeypatch.setenv("DATABASE_ASYNC", "false")
+    monkeypatch.setenv("DATABASE_URL", f"postgresql://postgres@127.0.0.1:{_closed_port()}/documents")
+    database = Database()
+    try:
+        with pytest.raises(DBAPIError):
+            database.sync_engine.connect()
+    finally:
+        database.sync_engine.dispose()
+
+@pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL is not set")
+def test_sync_engine_connects(monkeypatch):
+    monkeypatch.setenv("DATABASE_ASYNC", "false")
+    monkeypatch.setenv("DATABASE_URL", os.environ["TEST_DATABASE_URL"])
+    database = Database()
+    try:
+        with database.sync_engine.connect() as conn:
+            assert conn.execute(text("SELECT 1")).scalar() == 1
+    finally:
+        database.sync_engine.dispose()
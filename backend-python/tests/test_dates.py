@@ -0,0 +1,12 @@
+from datetime import datetime, timedelta, timezone
+
+from app.services.dates import to_naive_utc
+
+def test_aware_datetime_is_converted_to_naive_utc():
+    value = datetime(2024, 3, 1, 9, 30, tzinfo=timezone(timedelta(hours=5, minutes=30)))
+    assert to_naive_utc(value) == datetime(2024, 3, 1, 4, 0)
+
+def test_naive_datetime_and_none_are_unchanged():
+    value = datetime(2024, 3, 1, 9, 30)
+    assert to_naive_utc(value) is value
+    assert to_naive_utc(None) is None
@@ -0,0 +1,65 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime
+
+from app.models import Document, DocumentField, ExportFormat
+from app.services.export import encode_export
+
+def document(doc_id, title, **values):
+    return Document(
+        id=doc_id, title=title, created_at=datetime(2025, 9, 18, 12), updated_at=datetime(2025, 9, 18, 12), **values
+    )
+
+def partial(doc_id, **values):
+    # As built for a request with fields: only the selected fields are set
+    return Document.model_construct({"id", *values}, id=doc_id, **values)
+
+async def batches_of(*batches):
+    for batch in batches:
+        yield batch
+
+def encode(batches, export_format, fields=None):
+    async def collect():
+        return [chunk async for chunk in encode_export(batches, export_format, fields)]
+    return asyncio.run(collect())
+
+def test_ndjson_writes_one_line_per_document_and_chunk_per_batch():
+    chunks = encode(batches_of(
+        [document("1", "Water", country="India"), document("2", 'Roads, "rural"')],
+        [],
+        [document("3", "Schools", document_date=datetime(2024, 1, 2))],
+    ), ExportFormat.NDJSON)
+    assert len(chunks) == 3
+    lines = [json.loads(line) for line in b"".join(chunks).splitlines()]
+    assert [line["id"] for line in lines] == ["1", "2", "3"]
+    assert lines[1]["title"] == 'Roads, "rural"'
+    assert lines[2]["document_date"] == "2024-01-02T00:00:00"
+    assert lines[0]["country"] == "India"
+
+def test_ndjson_leaves_out_fields_that_were_not_selected():
+    chunks = encode(batches_of([partial("1", country="India")]), ExportFormat.NDJSON)
+    assert json.loads(b"".join(chunks)) == {"id": "1", "country": "India"}
+
+def test_csv_has_a_header_and_quotes_values():
+    chunks = encode(batches_of(
+        [document("1", 'Roads, "rural"', country="India")],
+        [document("2", "Water")],
+    ), ExportFormat.CSV)
+    rows = list(csv.reader(io.StringIO("".join(chunks))))
+    assert rows[0] == [field.value for field in DocumentField]
+    assert rows[1][:2] == ["1", 'Roads, "rural"']
+    assert rows[1][rows[0].index("country")] == "India"
+    assert rows[2][:2] == ["2", "Water"]
+    assert rows[2][rows[0].index("country")] == ""
+
+def test_csv_with_selected_fields():
+    chunks = encode(batches_of(
+        [partial("1", title="Water", country="India")],
+    ), ExportFormat.CSV, ["id", "title", "country"])
+    assert "".join(chunks) == "id,title,country\r\n1,Water,India\r\n"
+
+def test_empty_export_writes_only_the_csv_header():
+    assert encode(batches_of(), ExportFormat.NDJSON) == []
+    assert encode(batches_of(), ExportFormat.CSV, ["id", "title"]) == ["id,title\r\n"]
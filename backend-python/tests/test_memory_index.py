@@ -0,0 +1,107 @@
+import asyncio
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.services.memory_index import IndexFilters, MemoryIndex, tokenize
+
+Row = namedtuple("Row", "id title abstract country lang docty majdocty created_at updated_at")
+
+def row(doc_id, title, abstract="", country="India", updated_at=datetime(2024, 1, 1), created_at=datetime(2024, 1, 1)):
+    return Row(doc_id, title, abstract, country, "English", "Report", "Reports", created_at, updated_at)
+
+class FakeDatabase:
+    """
+    Serves the index's queries from a list of rows
+    """
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    async def stream(self, statement, params, batch_size, setup=None, read_only=False):
+        for start in range(0, len(self.rows), batch_size):
+            yield self.rows[start:start + batch_size]
+
+    async def run(self, fn, *args, read_only=False):
+        since = args[0]
+        return [r for r in self.rows if r.updated_at >= since]
+
+def loaded_index(rows, **kwargs):
+    index = MemoryIndex(FakeDatabase(rows), refresh_interval=60, **kwargs)
+    asyncio.run(index.load())
+    return index
+
+def ids(hits):
+    return [hit.id for hit in hits]
+
+def live_document_frequency(state, term):
+    slots, _ = state.postings[state.term_ids[term]]
+    return sum(1 for slot in slots if state.slots.get(state.ids[slot]) == slot)
+
+def test_tokenize_case_folds_words():
+    assert tokenize("Water-Supply, RURAL areas") == ["water", "supply", "rural", "areas"]
+    assert tokenize(None) == []
+
+def test_search_requires_every_term_and_ranks_by_bm25():
+    index = loaded_index([
+        row("1", "Water supply", "Rural water and sanitation"),
+        row("2", "Road project", "Water crossing"),
+        row("3", "Water", "Water water water"),
+        row("4", "Education", "Schools"),
+    ])
+    assert ids(index.search(["water"], IndexFilters())) == ["3", "1", "2"]
+    assert ids(index.search(["water", "rural"], IndexFilters())) == ["1"]
+    assert index.search(["water", "missing"], IndexFilters()) == []
+    assert index.search([], IndexFilters()) == []
+
+def test_ties_are_ordered_by_id():
+    index = loaded_index([row(doc_id, "Same title") for doc_id in ("b", "a", "c")])
+    hits = index.search(["same"], IndexFilters())
+    assert ids(hits) == ["a", "b", "c"]
+    assert len({hit.sort_key for hit in hits}) == 1
+
+def test_filters_and_facets():
+    index = loaded_index([
+        row("1", "Water", country="India", created_at=datetime(2024, 1, 1)),
+        row("2", "Water", country="Peru", created_at=datetime(2024, 6, 1)),
+        row("3", "Roads", country="Peru", created_at=datetime(2024, 6, 1)),
+    ])
+    assert ids(index.search(["water"], IndexFilters(country="Peru"))) == ["2"]
+    start = datetime(2024, 3, 1, 5, tzinfo=timezone(timedelta(hours=5)))
+    assert ids(index.search(["water"], IndexFilters(start_date=start))) == ["2"]
+    assert index.facet_counts(["water"], IndexFilters(), ["country"]) == {"country": {"India": 1, "Peru": 1}}
+    assert index.facet_counts(None, IndexFilters(), ["country"]) == {"country": {"India": 1, "Peru": 2}}
+
+def test_refresh_replaces_changed_documents():
+    rows = [row("1", "Water"), row("2", "Water roads")]
+    index = loaded_index(rows)
+    index.database.rows[0] = row("1", "Schools", updated_at=datetime(2024, 2, 1))
+    assert asyncio.run(index.refresh()) == 1
+    assert ids(index.search(["water"], IndexFilters())) == ["2"]
+    assert ids(index.search(["schools"], IndexFilters())) == ["1"]
+    assert index.document_count == 2
+
+def test_purge_drops_deleted_documents():
+    index = loaded_index([row(str(i), "Water") for i in range(4)])
+    del index.database.rows[:2]
+    assert asyncio.run(index.purge()) == 2
+    assert ids(index.search(["water"], IndexFilters())) == ["2", "3"]
+    assert index.facet_counts(None, IndexFilters(), ["country"]) == {"country": {"India": 2}}
+
+def test_document_frequency_counts_live_documents_only():
+    rows = [row(str(i), "Water" if i < 6 else "Roads", "common") for i in range(10)]
+    index = loaded_index(rows)
+    fresh = loaded_index(rows[4:])
+    del index.database.rows[:4]
+    asyncio.run(index.purge())
+    state = index._state
+    for term in ("water", "roads", "common"):
+        assert state.document_frequency[state.term_ids[term]] == live_document_frequency(state, term)
+    # Tombstones no longer affect scores: they match an index built from the live rows
+    assert index.search(["water"], IndexFilters()) == fresh.search(["water"], IndexFilters())
+
+def test_search_before_load_is_an_error():
+    index = MemoryIndex(FakeDatabase([]), refresh_interval=60)
+    assert not index.ready
+    with pytest.raises(RuntimeError):
+        index.search(["water"], IndexFilters())
@@ -0,0 +1,55 @@
+import pytest
+
+from app.services import token_budget
+from app.services.token_budget import CHARS_PER_TOKEN, SAFETY_MARGIN, TokenBudget, TokenCounter
+
+class CharacterEncoding:
+    """
+    Stand-in for a tiktoken encoding with one token per character
+    """
+    def encode(self, text, disallowed_special=()):
+        return list(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+def exact_counter(scale=1.0):
+    counter = TokenCounter("test-model", scale)
+    counter._encoding, counter._loaded = CharacterEncoding(), True
+    return counter
+
+@pytest.fixture
+def no_tiktoken(monkeypatch):
+    monkeypatch.setattr(token_budget, "tiktoken", None)
+
+def test_estimate_without_tiktoken(no_tiktoken):
+    counter = TokenCounter("test-model")
+    assert not counter.exact
+    assert counter.count("x" * (CHARS_PER_TOKEN * 3 + 1)) == 4
+    assert counter.count("") == 0
+
+def test_estimated_trim_keeps_the_beginning(no_tiktoken):
+    counter = TokenCounter("test-model")
+    text = "abcdefgh" * 10
+    trimmed = counter.trim(text, 5)
+    assert trimmed.text == text[:5 * CHARS_PER_TOKEN]
+    assert (trimmed.tokens, trimmed.original_tokens, trimmed.trimmed) == (5, 20, True)
+    untouched = counter.trim(text, 20)
+    assert (untouched.text, untouched.trimmed) == (text, False)
+
+def test_exact_count_is_scaled_up():
+    assert exact_counter().count("hello") == 5
+    assert exact_counter(scale=1.2).count("hello") == 6
+
+def test_exact_trim_stays_within_the_limit_after_scaling():
+    counter = exact_counter(scale=1.5)
+    trimmed = counter.trim("abcdefghij", 6)
+    assert trimmed.text == "abcd"
+    assert trimmed.tokens <= 6
+    assert trimmed.original_tokens == 15
+    assert counter.trim("abcd", 6).text == "abcd"
+
+def test_text_tokens_leave_room_for_output_template_and_margin():
+    budget = TokenBudget(exact_counter(), context_window=10_000, output_tokens=1_000)
+    assert budget.text_tokens(200) == int(10_000 * (1 - SAFETY_MARGIN)) - 1_000 - 200
+    assert budget.text_tokens(20_000) == 0
@@ -35,7 +35,15 @@ CREATE TABLE documents (
     author VARCHAR(500),
     publisher VARCHAR(500),
     isbn VARCHAR(50),
-    issn VARCHAR(50)
+    issn VARCHAR(50),
+
+    -- Weighted full-text search vector (title > abstract > content), kept current by Postgres.
+    -- content_text is truncated to stay under the 1MB tsvector limit.
+    search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(abstract, '')), 'B') ||
+        setweight(to_tsvector('english', left(coalesce(content_text, ''), 100000)), 'C')
+    ) STORED
 );
 
 -- Countries lookup table for normalization
@@ -128,6 +136,22 @@ CREATE TABLE document_access (
     FOREIGN KEY (document_id) REFERENCES documents(id)
 );
 
+-- Generated summaries, cached by the backend. The key includes hashes of the text sent
+-- to the model and of the prompt, so changed content or prompts never hit old rows.
+-- Summaries of PDFs are also stored with content_sha256 hashing the url and updated_at,
+-- so they can be found before the PDF is downloaded.
+CREATE TABLE document_summaries (
+    document_id VARCHAR(255) NOT NULL,
+    model VARCHAR(100) NOT NULL,
+    content_sha256 CHAR(64) NOT NULL,
+    prompt_version VARCHAR(64) NOT NULL,
+    summary_text TEXT NOT NULL,
+    generation_time_ms INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (document_id, model, content_sha256, prompt_version),
+    FOREIGN KEY (document_id) REFERENCES documents(id) ON DELETE CASCADE
+);
+
 -- Indexes for performance
 CREATE INDEX ix_documents_docdt ON documents(docdt);
 CREATE INDEX ix_documents_lang ON documents(lang);
@@ -155,6 +179,29 @@ CREATE INDEX ix_documents_title_trgm ON documents USING gin(title gin_trgm_ops);
 CREATE INDEX ix_documents_abstract_trgm ON documents USING gin(abstract gin_trgm_ops);
 CREATE INDEX ix_documents_content_trgm ON documents USING gin(content_text gin_trgm_ops);
 
+-- Full-text search index (search_mode = fulltext)
+CREATE INDEX ix_documents_search_vector ON documents USING gin(search_vector);
+
+-- Facet counts for the unfiltered corpus (/v1/search/facets without filters).
+-- Refreshed periodically by the backend; the unique index allows REFRESH ... CONCURRENTLY.
+CREATE MATERIALIZED VIEW document_facets AS
+SELECT facet, value, count FROM (
+    SELECT
+        CASE
+            WHEN GROUPING(country) = 0 THEN 'country'
+            WHEN GROUPING(lang) = 0 THEN 'language'
+            WHEN GROUPING(docty) = 0 THEN 'document_type'
+            ELSE 'major_document_type'
+        END AS facet,
+        COALESCE(country, lang, docty, majdocty) AS value,
+        COUNT(*) AS count
+    FROM documents
+    GROUP BY GROUPING SETS ((country), (lang), (docty), (majdocty))
+) AS grouped
+WHERE value IS NOT NULL;
+
+CREATE UNIQUE INDEX ix_document_facets_facet_value ON document_facets(facet, value);
+
 -- Trigger to update updated_at timestamp
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$